@@ -1,19 +1,143 @@
+import argparse
+import time
+
 from config import CONFIG
-from src.csv_processing import (
-    process_console_csv,
-    process_dashboard_csv,
-    save_merged_csv,
-)
+from src.manifest import DEFAULT_MANIFEST, load_manifest, plan_clients, save_manifest
+from src.incremental import DEFAULT_OVERLAP_HOURS
+from src.runner import merge_clients, print_summary
+from src.tariff import RATE_TABLE_WARNINGS
+from src.utils import peak_rss_mb, prefix_table_warnings
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Merge dashboard and console CSV exports per client.")
+    parser.add_argument(
+        "--columnar",
+        action="store_true",
+        help="Parse the dashboard export column-wise and build CallDetail objects lazily.",
+    )
+    parser.add_argument(
+        "--store",
+        action="store_true",
+        help="Merge into a columnar CallStore instead of one CallDetail object per call.",
+    )
+    parser.add_argument(
+        "--join",
+        action="store_true",
+        help="Like --store, but reconcile the console export with the dashboard in one outer join.",
+    )
+    parser.add_argument(
+        "--match-tolerance",
+        type=int,
+        default=None,
+        metavar="SECONDS",
+        help="With --join, also match calls without a sequence ID whose start times are this close.",
+    )
+    parser.add_argument(
+        "--memory-budget",
+        type=float,
+        default=None,
+        metavar="MB",
+        help="Merge out of core (external sort-merge through temporary files) within about this much memory.",
+    )
+    parser.add_argument(
+        "--parquet",
+        metavar="DIR",
+        default=None,
+        help="Also write the merged calls as typed Parquet files under DIR, partitioned by month and client.",
+    )
+    parser.add_argument(
+        "--parse-cache",
+        metavar="DIR",
+        default=None,
+        help="Cache each client's parsed, merged calls under DIR; reruns with unchanged exports only re-rate.",
+    )
+    parser.add_argument(
+        "--incremental",
+        metavar="DIR",
+        default=None,
+        help="Keep per-client merge state under DIR and only parse rows newer than the last run's watermark.",
+    )
+    parser.add_argument(
+        "--overlap-hours",
+        type=float,
+        default=DEFAULT_OVERLAP_HOURS,
+        help=f"With --incremental, rows this close to the watermark are re-read on the next run (default: {DEFAULT_OVERLAP_HOURS}).",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Merge every client, even those whose exports, config and rates are unchanged since the last run.",
+    )
+    parser.add_argument(
+        "--manifest",
+        default=DEFAULT_MANIFEST,
+        help=f"Where fingerprints of the last run are kept (default: {DEFAULT_MANIFEST}).",
+    )
+    parser.add_argument(
+        "--chunk-rows",
+        type=int,
+        default=None,
+        help="Stream the console export in chunks of this many rows to bound memory use.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Merge this many clients in parallel, one process each.",
+    )
+    args = parser.parse_args()
+    check_combinations(parser, args)
+    return args
+
+
+def check_combinations(parser: argparse.ArgumentParser, args: argparse.Namespace) -> None:
+    """Stop on options that would be silently ignored together (and recorded in the manifest as applied)."""
+    if args.incremental:
+        ignored = {
+            "--join": args.join,
+            "--match-tolerance": args.match_tolerance is not None,
+            "--memory-budget": args.memory_budget is not None,
+            "--parse-cache": args.parse_cache is not None,
+            "--chunk-rows": args.chunk_rows is not None,
+        }
+        conflicting = [flag for flag, given in ignored.items() if given]
+        if conflicting:
+            parser.error(f"--incremental cannot be combined with {', '.join(conflicting)}")
+    if (args.join or args.match_tolerance is not None) and args.chunk_rows is not None:
+        parser.error("--join and --match-tolerance read the console export at once; drop --chunk-rows")
 
 
 def __main__():
+    args = parse_args()
     print(f"Starting Auto-Anna CSV merger")
-    for files in CONFIG:
-        print(f"> Merging files for client {files.client}")
-        call_details = process_dashboard_csv(files.dashboard, files.carrier, client=files.client)
-        call_details = process_console_csv(files.console, files.carrier, call_details, client=files.client)
-        save_merged_csv(call_details, files.output)
+    for warning in prefix_table_warnings() + RATE_TABLE_WARNINGS:
+        print(warning)
+    started = time.perf_counter()
+    options = dict(
+        columnar=args.columnar,
+        chunk_rows=args.chunk_rows,
+        store=args.store,
+        join=args.join,
+        match_tolerance=args.match_tolerance,
+        memory_budget=args.memory_budget,
+        parquet_root=args.parquet,
+        parse_cache=args.parse_cache,
+        incremental=args.incremental,
+        overlap_hours=args.overlap_hours,
+    )
+    manifest = load_manifest(args.manifest)
+    to_merge, skipped, fingerprints = plan_clients(CONFIG, manifest, options, force=args.force)
+    for files in skipped:
+        print(f"> Skipping client {files.client}: exports, config and rates unchanged")
+    results = merge_clients(to_merge, workers=args.workers, **options)
+    save_manifest(args.manifest, fingerprints)
     print("All files merged successfully")
+    print_summary(results, time.perf_counter() - started, [files.client for files in skipped])
+    peak_rss = peak_rss_mb()
+    if peak_rss is not None and args.workers <= 1:
+        print(f"Peak RSS: {peak_rss:.1f} MB")
 
 
-__main__()
\ No newline at end of file
+if __name__ == "__main__":
+    __main__()
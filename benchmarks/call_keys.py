@@ -0,0 +1,115 @@
+"""Merge keys of calls without a sequence ID: construction rate and merge dict memory per key style.
+
+"string" is the old call_hash: dateutil/pytz over the start time, then a
+"from|to|ISO" string. "tuple" is (from, to, epoch seconds) and "digest" is
+the current call_hash, a 64-bit digest of the same three values. The string
+style is timed both from the raw export text (what dateutil used to parse)
+and from already parsed datetimes; the other two start from epoch seconds.
+Memory is what a {key: row} dict over all the calls takes, keys included.
+
+Also checks that digests of distinct calls do not collide, that a call
+gets the same key whatever offset its start was recorded in, and that a
+call without an ID or a start gets no digest but a key of its own per
+export row. Exits with status 1 if any of these fails. Run from the
+repository root:
+
+    python -m benchmarks.call_keys [calls]
+"""
+import gc
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+import pytz
+from dateutil.parser import parse
+
+from src.CallDetail import CallDetail
+from src.utils import call_hash, to_epoch_seconds, unkeyed_call_key
+
+JAKARTA = timezone(timedelta(hours=7))
+
+
+def string_key(call_from, call_to, dial_start_at) -> str:
+    """The old call_hash."""
+    dt = parse(dial_start_at) if isinstance(dial_start_at, str) else dial_start_at
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=pytz.UTC)
+    dt = dt.astimezone(pytz.UTC).replace(microsecond=0)
+    return f"{call_from}|{call_to}|{dt.isoformat()}"
+
+
+def synthetic_calls(count: int, seed: int = 24) -> list[tuple[int, int, datetime]]:
+    rng = random.Random(seed)
+    start = datetime(2025, 7, 1)
+    return [
+        (rng.randrange(10**9, 10**11), rng.randrange(10**9, 10**11), start + timedelta(seconds=rng.randrange(31 * 86400)))
+        for _ in range(count)
+    ]
+
+
+def start_less_failures() -> list[str]:
+    """What goes wrong for calls with neither a sequence ID nor a start time."""
+    failures = []
+    if call_hash(81200000000, 2155550000, None) is not None:
+        failures.append("call_hash without a start is not None")
+    call = CallDetail("start-less", "nan", "bob", "081200000000", "0215550000", "Outbound call",
+                      "-", "-", "-", "0:00:00", "0:00:00", "-", 0, "")
+    if call.final_key is not None:
+        failures.append(f"final_key without an ID or a start is {call.final_key!r}, not None")
+    keys = {unkeyed_call_key(source, row) for source in ("dashboard", "console") for row in range(3)}
+    if len(keys) != 6:
+        failures.append("unkeyed_call_key repeats a key")
+    return failures
+
+
+def rate(build, inputs) -> float:
+    begin = time.perf_counter()
+    for call_from, call_to, start in inputs:
+        build(call_from, call_to, start)
+    return len(inputs) / (time.perf_counter() - begin)
+
+
+def bytes_per_key(build, inputs) -> float:
+    gc.collect()
+    tracemalloc.start()
+    merged = {build(call_from, call_to, start): row for row, (call_from, call_to, start) in enumerate(inputs)}
+    used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del merged
+    return used / len(inputs)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    calls = synthetic_calls(count)
+    as_text = [(call_from, call_to, start.isoformat(" ")) for call_from, call_to, start in calls]
+    as_seconds = [(call_from, call_to, to_epoch_seconds(start)[0]) for call_from, call_to, start in calls]
+
+    digests = {call_hash(*call) for call in as_seconds}
+    collisions = len({call for call in as_seconds}) - len(digests)
+    shifted = sum(
+        call_hash(call_from, call_to, to_epoch_seconds(start)[0])
+        != call_hash(call_from, call_to, to_epoch_seconds((start + timedelta(hours=7)).replace(tzinfo=JAKARTA))[0])
+        for call_from, call_to, start in calls[:10_000]
+    )
+    print(f"{count:,} synthetic calls, {collisions} digest collisions, {shifted} keys that depend on the offset")
+    failures = start_less_failures()
+    for failure in failures:
+        print(f"> {failure}")
+
+    print(f"{'key style':28}{'keys/s':>12}{'bytes/key':>12}")
+    styles = [
+        ("string, parsed from text", string_key, as_text),
+        ("string, from datetimes", string_key, calls),
+        ("tuple", lambda call_from, call_to, seconds: (call_from, call_to, seconds), as_seconds),
+        ("digest (call_hash)", call_hash, as_seconds),
+    ]
+    for name, build, inputs in styles:
+        print(f"{name:28}{rate(build, inputs):12,.0f}{bytes_per_key(build, inputs):12.0f}")
+    sys.exit(1 if collisions or shifted or failures else 0)
+
+
+if __name__ == "__main__":
+    main()
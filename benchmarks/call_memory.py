@@ -0,0 +1,74 @@
+"""Bytes per call record: __dict__ objects with datetime/timedelta vs slotted CallDetail.
+
+"Before" mirrors the old CallDetail layout: a plain object whose __dict__
+holds datetime and timedelta values. "After" is the current CallDetail.
+Both hold the same synthetic calls. Run from the repository root:
+
+    python -m benchmarks.call_memory [calls]
+"""
+import gc
+import random
+import sys
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+from src.CallDetail import CallDetail
+
+JAKARTA = timezone(timedelta(hours=7))
+
+
+class DictCallDetail:
+    """The pre-slots layout: same attributes, stored in a per-instance __dict__."""
+
+    def __init__(self, **fields):
+        for name, value in fields.items():
+            setattr(self, name, value)
+        self._matched_client = None
+
+
+def synthetic_fields(count: int, seed: int = 3):
+    rng = random.Random(seed)
+    start = datetime(2025, 7, 1)
+    for index in range(count):
+        begin = start + timedelta(seconds=rng.randrange(31 * 86400))
+        duration = timedelta(seconds=rng.randrange(3600))
+        yield dict(
+            client="gwm-id",
+            sequence_id=f"seq-{index:09d}",
+            user_name="-",
+            call_from=rng.randrange(10**9, 10**11),
+            call_to=rng.randrange(10**9, 10**11),
+            call_type="Outbound call",
+            dial_start_at=begin,
+            dial_answered_at=(begin + timedelta(seconds=5)).replace(tzinfo=JAKARTA),
+            dial_end_at=(begin + duration).replace(tzinfo=JAKARTA),
+            ringing_time=timedelta(seconds=rng.randrange(60)),
+            call_duration=duration,
+            call_memo="-",
+            call_charge="0",
+            carrier="Telkom",
+            number_type="DOMESTIC",
+        )
+
+
+def bytes_per_record(build, count: int) -> float:
+    gc.collect()
+    tracemalloc.start()
+    records = [build(fields) for fields in synthetic_fields(count)]
+    used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del records
+    return used / count
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    print(f"{count:,} synthetic calls")
+    before = bytes_per_record(lambda fields: DictCallDetail(**fields), count)
+    after = bytes_per_record(lambda fields: CallDetail(**fields), count)
+    print(f"__dict__ + datetime/timedelta  {before:8.0f} bytes/record")
+    print(f"slotted CallDetail             {after:8.0f} bytes/record  ({after / before:.0%})")
+
+
+if __name__ == "__main__":
+    main()
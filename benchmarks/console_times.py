@@ -0,0 +1,66 @@
+"""Batch UTC -> local conversion of console times against parse_jakarta_datetime.
+
+Checks local_epoch_column against the scalar function on random and edge-case
+timestamps (leap days, month ends, "nan", values strptime accepts but the
+fixed layout does not), then times both. Exits with status 1 on any
+disagreement. Run from the repository root:
+
+    python -m benchmarks.console_times [rows]
+"""
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from src.columnar import local_datetimes, local_epoch_column
+from src.utils import parse_jakarta_datetime
+
+EDGE_CASES = [
+    "nan", "2024-02-29 23:59:59", "2025-12-31 17:00:00", "2025-01-01 00:00:00", "1970-01-01 00:00:00",
+    "2000-02-29 12:00:00", "2025-7-1 1:02:03", "2025-07-01 1:02:03", "0001-01-01 07:00:00", "9999-12-31 16:59:59",
+]
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    rng = random.Random(23)
+    start = datetime(2020, 1, 1)
+    values = EDGE_CASES + [
+        (start + timedelta(seconds=rng.randrange(10 * 366 * 86400))).strftime("%Y-%m-%d %H:%M:%S")
+        for _ in range(rows - len(EDGE_CASES))
+    ]
+    values = pd.Series(values)
+    regions = pd.Series(["jkt"] * len(values))
+
+    started = time.perf_counter()
+    expected = [parse_jakarta_datetime(value, region) for value, region in zip(values, regions)]
+    scalar_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    seconds, offsets = local_epoch_column(values, regions)
+    batch_seconds = time.perf_counter() - started
+
+    got = local_datetimes(seconds, offsets)
+    failures = 0
+    for value, want, have in zip(values, expected, got):
+        if want != have or (want is not None and want.utcoffset() != have.utcoffset()):
+            print(f"{value!r}: {have!r} != {want!r}")
+            failures += 1
+    for bad in ("2025-02-29 00:00:00", "2025-07-01 24:00:00", "2025-07-01T00:00:00"):
+        try:
+            local_epoch_column(pd.Series([bad]), pd.Series(["jkt"]))
+        except ValueError:
+            continue
+        print(f"{bad!r} was accepted")
+        failures += 1
+
+    print(f"{len(values):,} timestamps, {failures} disagreements")
+    print(f"parse_jakarta_datetime: {len(values) / scalar_seconds:12,.0f} values/s")
+    print(f"local_epoch_column:     {len(values) / batch_seconds:12,.0f} values/s")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
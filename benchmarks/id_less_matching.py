@@ -0,0 +1,96 @@
+"""Calls without a sequence ID seen by both exports must come out as one row.
+
+Writes a small dashboard export (Jakarta wall-clock times) and a console
+export (UTC) describing the same calls, none of them with an ID. A third
+of the console starts are exact, the rest are 1 or 2 seconds late. Every
+merge path must pair the exact ones by key; --match-tolerance 2 must pair
+all of them. A few more rows on each side have no start time either; they
+must not stop the merge and each one stays a row of its own. Exits with
+status 1 otherwise. Run from the repository root:
+
+    python -m benchmarks.id_less_matching [calls]
+"""
+import csv
+import os
+import random
+import sys
+import tempfile
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+
+from src.FileConfig import Files
+from src.runner import merge_client
+
+JAKARTA_OFFSET = timedelta(hours=7)
+# Rows per export without an ID or a start time.
+UNKEYED_ROWS = 3
+DASHBOARD_COLUMNS = ["Sequence ID", "User name", "Call from", "Call to", "Call type", "Dial begin time",
+                     "Call begin time", "Call end time", "Ringing time", "Call duration", "Call memo"]
+CONSOLE_COLUMNS = ["call_id", "used_number", "number", "call_type", "dial_starts_at", "dial_answered_at", "dial_ends_at",
+                   "pbx_region", "all_duration_of_call_sec_str", "duration_of_call_sec_str", "discount", "number_type"]
+# name -> merge_client options
+PATHS = {
+    "dict": {},
+    "columnar": {"columnar": True},
+    "store": {"store": True},
+    "join": {"join": True},
+    "out of core": {"memory_budget": 64},
+    "tolerance 2s": {"match_tolerance": 2},
+}
+
+
+def write_exports(directory: str, count: int, seed: int = 15) -> tuple[Files, int]:
+    """Both exports of count calls; returns their Files entry and how many console starts are exact."""
+    rng = random.Random(seed)
+    dashboard_rows, console_rows, exact = [], [], 0
+    for index in range(count):
+        call_from, call_to = f"0812{index:07d}", f"021{rng.randrange(10**7):07d}"
+        local_start = datetime(2025, 7, 1) + timedelta(seconds=rng.randrange(30 * 86400))
+        skew = index % 3
+        exact += skew == 0
+        utc_start = local_start - JAKARTA_OFFSET + timedelta(seconds=skew)
+        dashboard_rows.append(["", "alice", call_from, call_to, "Outbound call", f"{local_start:%Y-%m-%d %H:%M:%S}",
+                               "-", f"{local_start + timedelta(seconds=30):%Y-%m-%d %H:%M:%S}", "0:00:10", "0:00:20", "x"])
+        console_rows.append(["", call_from, call_to, "OUTGOING_CALL", f"{utc_start:%Y-%m-%d %H:%M:%S}", "",
+                             f"{utc_start + timedelta(seconds=30):%Y-%m-%d %H:%M:%S}", "jkt", "0:00:10", "0:00:20", "0", "MOBILE"])
+    for index in range(UNKEYED_ROWS):
+        position = rng.randrange(len(dashboard_rows))
+        dashboard_rows.insert(position, ["", "bob", "08120000000", "0215550000", "Outbound call", "-", "-", "-", "0:00:00", "0:00:00", "-"])
+        console_rows.insert(position, ["", "08120000000", "0215550000", "OUTGOING_CALL", "", "", "", "jkt", "0:00:00", "0:00:00", "0", "MOBILE"])
+    files = Files(
+        client="id-less-check",
+        dashboard=os.path.join(directory, "dashboard.csv"),
+        console=os.path.join(directory, "console.csv"),
+        output=os.path.join(directory, "merged.csv"),
+    )
+    for path, columns, rows in ((files.dashboard, DASHBOARD_COLUMNS, dashboard_rows), (files.console, CONSOLE_COLUMNS, console_rows)):
+        with open(path, "w", newline="") as export:
+            writer = csv.writer(export)
+            writer.writerow(columns)
+            writer.writerows(rows)
+    return files, exact
+
+
+def merged_rows(files: Files, options: dict) -> int:
+    with redirect_stdout(open(os.devnull, "w")):
+        merge_client(files, **options)
+    with open(files.output, newline="") as merged:
+        return sum(1 for _ in csv.reader(merged)) - 1
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    failed = False
+    with tempfile.TemporaryDirectory() as directory:
+        files, exact = write_exports(directory, count)
+        skewed = count - exact
+        for name, options in PATHS.items():
+            expected = (count if "match_tolerance" in options else count + skewed) + 2 * UNKEYED_ROWS
+            rows = merged_rows(files, options)
+            failed |= rows != expected
+            print(f"{name:<14} {rows:6,} rows (expected {expected:,}){'' if rows == expected else '  MISMATCH'}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""Lookups per second for overseas number classification.
+
+Compares the old first-match scan over INTERNATIONAL_PHONE_PREFIXES with the
+compiled longest-match index. Run from the repository root:
+
+    python -m benchmarks.international_prefixes [count]
+"""
+import random
+import sys
+import time
+
+from src.idn_area_codes import INTERNATIONAL_PHONE_PREFIXES
+from src.utils import classify_international_number
+
+
+def first_match_scan(phone_number_str: str) -> str:
+    for prefix, country in INTERNATIONAL_PHONE_PREFIXES.items():
+        if phone_number_str.startswith(str(prefix).replace("+", "")):
+            return f"International - {country}"
+    return "International - Unknown"
+
+
+def random_overseas_numbers(count: int, seed: int = 7) -> list[str]:
+    rng = random.Random(seed)
+    prefixes = [str(prefix) for prefix in INTERNATIONAL_PHONE_PREFIXES] + ["99", "28", "69"]
+    return [rng.choice(prefixes) + str(rng.randrange(10**6, 10**9)) for _ in range(count)]
+
+
+def measure(label: str, classify, numbers: list[str]) -> list[str]:
+    started = time.perf_counter()
+    results = [classify(number) for number in numbers]
+    elapsed = time.perf_counter() - started
+    print(f"{label:<18} {len(numbers) / elapsed:>12,.0f} lookups/s  ({elapsed:.2f}s)")
+    return results
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    numbers = random_overseas_numbers(count)
+    print(f"{count:,} random overseas numbers")
+    scanned = measure("first-match scan", first_match_scan, numbers)
+    indexed = measure("longest-match", classify_international_number, numbers)
+    changed = sum(old != new for old, new in zip(scanned, indexed))
+    print(f"{changed:,} numbers classified differently (longer prefix now wins)")
+
+
+if __name__ == "__main__":
+    main()
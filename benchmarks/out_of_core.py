@@ -0,0 +1,96 @@
+"""Out-of-core merge of a synthetic dashboard/console pair under a memory cap.
+
+Writes a dashboard and a console export of the given number of rows each
+(streamed to disk, so generating them costs no memory), merges them with
+merge_files_out_of_core under the given budget, and checks that the peak
+RSS of the whole process stayed below the budget. Exits with status 1 if
+it did not. Run from the repository root:
+
+    python -m benchmarks.out_of_core [rows] [budget_mb]
+
+The defaults (20,000,000 rows, 512 MB) need ~5 GB of free disk for the
+inputs, the run files and the output.
+"""
+import csv
+import dataclasses
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from config import CONFIG
+from src.external_merge import merge_files_out_of_core
+from src.utils import peak_rss_mb
+
+DASHBOARD_HEADER = [
+    "Sequence ID", "User name", "Call from", "Call to", "Call type", "Dial begin time",
+    "Call begin time", "Call end time", "Ringing time", "Call duration", "Call memo",
+]
+CONSOLE_HEADER = [
+    "call_id", "used_number", "number", "call_type", "dial_starts_at", "dial_answered_at", "dial_ends_at",
+    "pbx_region", "all_duration_of_call_sec_str", "duration_of_call_sec_str", "discount", "number_type",
+]
+NUMBERS = ["+62 812-3456-7890", "081298765432", "02150981440", "2150913403", "0800123456", "112", "+6591234567"]
+
+
+def clock(seconds: int) -> str:
+    return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def write_pair(directory: str, rows: int, seed: int = 16) -> tuple[str, str]:
+    """Dashboard and console exports sharing most calls, in unrelated orders."""
+    rng = random.Random(seed)
+    start = datetime(2025, 7, 1)
+    dashboard_path, console_path = os.path.join(directory, "dashboard.csv"), os.path.join(directory, "console.csv")
+    with open(dashboard_path, "w", newline="") as dashboard, open(console_path, "w", newline="") as console:
+        dashboard_writer, console_writer = csv.writer(dashboard), csv.writer(console)
+        dashboard_writer.writerow(DASHBOARD_HEADER)
+        console_writer.writerow(CONSOLE_HEADER)
+        for index in range(rows):
+            begin = start + timedelta(seconds=rng.randrange(31 * 86400))
+            ringing, duration = rng.randrange(60), rng.randrange(3600)
+            call_from, call_to = rng.choice(NUMBERS), rng.choice(NUMBERS)
+            dashboard_writer.writerow([
+                f"seq-{index:09d}", rng.choice(["alice", "bob", ""]), call_from, call_to, "Outbound call",
+                begin.strftime("%Y-%m-%d %H:%M:%S"), (begin + timedelta(seconds=ringing)).strftime("%Y-%m-%d %H:%M:%S"),
+                (begin + timedelta(seconds=ringing + duration)).strftime("%Y-%m-%d %H:%M:%S"),
+                clock(ringing), clock(duration), "",
+            ])
+            # Console rows arrive in a different order: mostly the same calls, some of their own.
+            other = index if rng.random() < 0.9 else rows + index
+            utc = begin - timedelta(hours=7)
+            console_writer.writerow([
+                f"seq-{(index * 7919) % rows if other == index else other:09d}", call_from.replace(" ", ""), call_to,
+                "OUTGOING_CALL", utc.strftime("%Y-%m-%d %H:%M:%S"), utc.strftime("%Y-%m-%d %H:%M:%S"),
+                (utc + timedelta(seconds=duration)).strftime("%Y-%m-%d %H:%M:%S"), "jkt",
+                clock(ringing), clock(duration), "0", "MOBILE",
+            ])
+    return dashboard_path, console_path
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000_000
+    budget_mb = float(sys.argv[2]) if len(sys.argv) > 2 else 512
+    with tempfile.TemporaryDirectory(prefix="auto-anna-bench-") as directory:
+        started = time.perf_counter()
+        dashboard, console = write_pair(directory, rows)
+        print(f"{rows:,} rows per export written in {time.perf_counter() - started:.0f}s")
+
+        files = dataclasses.replace(
+            CONFIG[0], dashboard=dashboard, console=console, output=os.path.join(directory, "merged.csv")
+        )
+        started = time.perf_counter()
+        calls = merge_files_out_of_core(files, budget_mb, temp_dir=directory)
+        elapsed = time.perf_counter() - started
+
+    peak = peak_rss_mb()
+    print(f"{calls:,} calls merged in {elapsed:.0f}s ({calls / elapsed:,.0f} calls/s)")
+    print(f"peak RSS {peak:.0f} MB, budget {budget_mb:.0f} MB")
+    if peak is not None and peak > budget_mb:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Batch phone normalization against parse_phone_number on a fuzz corpus.
+
+Checks that normalize_phone_numbers agrees with the scalar function on every
+value it marks valid, that it marks valid exactly the values the scalar
+function turns into an int64, and that normalize_phone_column is identical to
+mapping parse_phone_number. Then times the scalar and batch versions on
+repeated realistic numbers and on the corpus itself. Exits with
+status 1 on any disagreement. Run from the repository root:
+
+    python -m benchmarks.phone_normalizer [values]
+"""
+import random
+import sys
+import time
+
+import pandas as pd
+
+from src.columnar import PHONE_MAX_CHARS, normalize_phone_column, normalize_phone_numbers
+from src.utils import parse_phone_number
+
+REALISTIC = ["+62 812-3456-7890", "081298765432", "(021) 5098-1440", "2150913403", "0800123456", "112", "+6591234567"]
+ALPHABET = "0123456789" * 4 + "+-() 62" * 3 + "abcx\t_.٣\x00"
+SPECIAL = ["", "nan", "scancall", "62", "0", "620", "6262", "00", "+", "()", "-0-", "62abc", "6262x", "1_000",
+           "9" * 18, "9" * 19, "62" + "9" * 18, "0" + "9" * 18, "0" * 40 + "1", "1" * 33, " 12 ", "\t12", "١٢٣"]
+
+
+def fuzz_corpus(count: int, seed: int = 22) -> list[str]:
+    rng = random.Random(seed)
+    corpus = list(SPECIAL)
+    while len(corpus) < count:
+        kind = rng.random()
+        if kind < 0.4:
+            corpus.append(rng.choice(REALISTIC))
+        elif kind < 0.8:
+            corpus.append(rng.choice(["", "0", "62", "+62", "(0"]) + "".join(rng.choice("0123456789 -") for _ in range(rng.randrange(1, 22))))
+        else:
+            corpus.append("".join(rng.choice(ALPHABET) for _ in range(rng.randrange(0, 40))))
+    return corpus
+
+
+def check(corpus: list[str]) -> int:
+    numbers, valid = normalize_phone_numbers(pd.Series(corpus))
+    failures = 0
+    for value, number, is_valid in zip(corpus, numbers, valid):
+        expected = parse_phone_number(value)
+        fits = isinstance(expected, int) and -(2**63) <= expected < 2**63 and len(str(expected)) <= 18
+        if is_valid and expected != number:
+            print(f"mismatch for {value!r}: {number} != {expected!r}")
+            failures += 1
+        elif not is_valid and fits and value.isascii() and len(value) <= PHONE_MAX_CHARS and "_" not in value and "\t" not in value:
+            # Values the batch path leaves to the scalar function must not be plain numbers.
+            print(f"{value!r} marked invalid, parse_phone_number gives {expected!r}")
+            failures += 1
+    column = normalize_phone_column(pd.Series(corpus)).tolist()
+    scalar = [parse_phone_number(value) for value in corpus]
+    for value, got, expected in zip(corpus, column, scalar):
+        if got != expected or type(got) is not type(expected):
+            print(f"normalize_phone_column({value!r}) = {got!r}, parse_phone_number gives {expected!r}")
+            failures += 1
+    return failures
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    corpus = fuzz_corpus(count)
+    failures = check(corpus)
+    print(f"{len(corpus):,} fuzzed values, {failures} disagreements")
+
+    rng = random.Random(1)
+    # A month of calls repeats a few thousand numbers; the fuzz corpus is nearly all distinct.
+    numbers = [f"+62 8{rng.randrange(10**9, 10**10)}" for _ in range(5000)] + REALISTIC
+    for label, sample in (
+        ("repeated numbers", pd.Series([rng.choice(numbers) for _ in range(count)])),
+        ("fuzz corpus", pd.Series(corpus)),
+    ):
+        started = time.perf_counter()
+        scalar = sample.map(parse_phone_number)
+        scalar_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        normalize_phone_numbers(sample)
+        batch_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        column = normalize_phone_column(sample)
+        column_seconds = time.perf_counter() - started
+        assert column.tolist() == scalar.tolist()
+        print(f"{label}:")
+        print(f"  parse_phone_number:      {count / scalar_seconds:12,.0f} values/s")
+        print(f"  normalize_phone_numbers: {count / batch_seconds:12,.0f} values/s")
+        print(f"  normalize_phone_column:  {count / column_seconds:12,.0f} values/s")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""Calls rated per second: compiled tariff vs the per-call if-chain vs batch.
+
+Rates the same synthetic calls for every client in CONFIG three ways: the
+if-chain calculate_call_charge used before tariffs were compiled (kept below
+for reference), CallDetail.calculate_call_charge, and rate_batch_values over
+each client's calls at once. Checks that all give the same charges, as written to the CSV, and that
+resolve_batch agrees with resolve_call on calls with missing fields.
+Run from the repository root:
+
+    python -m benchmarks.tariff_rating [calls]
+"""
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from config import CONFIG
+from src.CallDetail import CallDetail
+from src.idn_area_codes import EMERGENCY_NUMBERS
+from src.tariff import international_rate, rate_batch_values, resolve_batch, tariff_for
+from src.utils import format_charge
+
+CALL_TYPES = ["Outbound call", "Incoming call", "Predictive dialer", "Answering machine", "Internal Call", "play_sound", "read_dtmf", "Call transfer"]
+NUMBER_TYPES = ["", "", "OVERSEAS"]
+
+
+def handle_number_charge(call, number, allowed_types, rate, rate_type, call_type, call_to, call_from):
+    if call_type in allowed_types and (call_to == number or call_from == number):
+        if rate == 0:
+            rate = 720
+        if rate_type == "per_minute":
+            return call.calculate_per_minute_charge(rate)
+        elif rate_type == "per_second":
+            return call.calculate_per_second_charge(rate)
+    return None
+
+
+def if_chain_charge(call) -> str:
+    SPECIAL_ZERO_CHARGE_CALLERS = {"2150913403", "85161662298", "85157455618", "82248400487", "2150913400", "2131141271"}
+    config = call.matched_client
+
+    call_to = str(call.call_to or "").strip()
+    call_from = str(call.call_from or "").strip()
+    call_type = (call.call_type or "").strip().lower()
+    iso = call.iso.lower() if call.iso else ""
+    chargeable_types = [ct.lower() for ct in config.chargeable_call_types] if config.chargeable_call_types else ["outbound call", "predictive dialer"]
+
+    if not config:
+        return call.calculate_per_minute_charge(720)
+
+    if call_from in SPECIAL_ZERO_CHARGE_CALLERS and call.matched_client and call.matched_client.client == "siemens-id":
+        return "0"
+
+    #Excluded number type
+    if iso == "internal call":
+        return call.calculate_per_minute_charge(0)
+
+    # Premium call handling
+    if iso in ["premium call", "toll-free", "split charge"] or iso in EMERGENCY_NUMBERS.values():
+        rate = 1700 + (200 if call.is_enduser else 0)
+        return call.calculate_per_minute_charge(rate)
+
+    # International call handling: exact match on the compiled per-carrier table
+    base_rate = international_rate(config.carrier, iso)
+
+    if base_rate is not None:
+        if call.is_enduser:
+            base_rate += 200
+        return call.calculate_per_minute_charge(base_rate)
+
+    # Specific number logic for S2C
+    s2c_target = call_to or call_from  # fallback if call_to is empty
+    s2c_list = config.s2c if isinstance(config.s2c, list) else [config.s2c]
+    if (s2c_target in s2c_list or iso == "scancall"):
+        if call_type in ["incoming call", "answering machine"]:
+            if config.s2c_rate_type == "per_minute":
+                return call.calculate_per_minute_charge(config.s2c_rate)
+            elif config.s2c_rate_type == "per_second":
+                return call.calculate_per_second_charge(config.s2c_rate)
+
+        elif call_type in chargeable_types:
+            if config.s2c_rate_type == "per_minute":
+                return call.calculate_per_minute_charge(config.s2c_rate)
+            elif config.s2c_rate_type == "per_second":
+                return call.calculate_per_second_charge(config.s2c_rate)
+
+    number1_cts = [ct.lower() for ct in (config.number1_chargeable_call_types or [])]
+    result = handle_number_charge(
+        call,
+        config.number1,
+        number1_cts,
+        config.number1_rate or 0,
+        config.number1_rate_type or "per_minute",
+        call_type,
+        call_to,
+        call_from
+    )
+    if result:
+        return result
+
+    number2_cts = [ct.lower() for ct in (config.number2_chargeable_call_types or [])]
+    result = handle_number_charge(
+        call,
+        config.number2,
+        number2_cts,
+        config.number2_rate or 0,
+        config.number2_rate_type or "per_minute",
+        call_type,
+        call_to,
+        call_from
+    )
+    if result:
+        return result
+
+    # Otherwise, fallback to general chargeable_call_types (for all other calls)
+    allowed_types = [ct.lower() for ct in getattr(config, "chargeable_call_types", [])]
+    if not allowed_types or call_type in allowed_types:
+        rate_type = getattr(config, "rate_type", "per_minute")
+        rate = getattr(config, "rate", 0)
+        if rate_type == "per_minute":
+            return call.calculate_per_minute_charge(rate)
+        elif rate_type == "per_second":
+            return call.calculate_per_second_charge(rate)
+
+    # General chargeable logic
+    if call_type in chargeable_types:
+        if config.rate_type == "per_second":
+            return call.calculate_per_second_charge(config.rate if config.rate is not None else 720)
+        else:
+            return call.calculate_per_minute_charge(config.rate if config.rate is not None else 720)
+
+    # Excluded call types
+    if call_type not in chargeable_types:
+        return call.calculate_per_minute_charge(0)
+
+    return call.calculate_per_minute_charge(720)
+
+
+def synthetic_calls(count: int, seed: int = 11) -> list[CallDetail]:
+    """Random calls over all clients, classified but not yet rated."""
+    rng = random.Random(seed)
+    numbers = ["81234567890", "2150913403", "2150981440", "2150981441", "30000352", "30000077", "2130422260", "8401234567", "112", "1500123", "scancall", "201", "18095551234", "4367612345"]
+    for files in CONFIG:
+        numbers.extend(str(number) for number in (files.number1, files.number2, files.s2c) if number and not isinstance(number, list))
+    start = datetime(2025, 7, 1)
+    calls = [
+        CallDetail(
+            client=rng.choice(CONFIG).client,
+            sequence_id=str(index),
+            user_name="-",
+            call_from=rng.choice(numbers),
+            call_to=rng.choice(numbers),
+            call_type=rng.choice(CALL_TYPES),
+            dial_start_at=start,
+            dial_answered_at=start,
+            dial_end_at=start,
+            ringing_time=timedelta(seconds=rng.randrange(60)),
+            call_duration=timedelta(seconds=rng.randrange(3600)),
+            call_memo="",
+            call_charge="0",
+            carrier="",
+            number_type=rng.choice(NUMBER_TYPES),
+        )
+        for index in range(count)
+    ]
+    for call in calls:
+        call.iso = call.classify()
+    return calls
+
+
+def measure(label: str, rate_all, calls) -> list[str]:
+    started = time.perf_counter()
+    charges = rate_all(calls)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<16} {len(charges) / elapsed:>12,.0f} calls/s  ({elapsed:.2f}s)")
+    return charges
+
+
+def client_batches(calls: list[CallDetail]) -> list[tuple[list[int], tuple]]:
+    """Per-client column arrays, built up front so only rating is timed."""
+    by_client: dict[str, list[int]] = {}
+    for position, call in enumerate(calls):
+        by_client.setdefault(call.client, []).append(position)
+
+    batches = []
+    for positions in by_client.values():
+        batch = [calls[position] for position in positions]
+        columns = (
+            batch[0].matched_client,
+            np.array([int(call.call_duration.total_seconds()) for call in batch]),
+            np.array([call.call_type for call in batch], dtype=object),
+            np.array([call.iso for call in batch], dtype=object),
+            np.array([call.call_from for call in batch], dtype=object),
+            np.array([call.call_to for call in batch], dtype=object),
+        )
+        batches.append((positions, columns))
+    return batches
+
+
+def rate_in_batches(batches: list[tuple[list[int], tuple]]) -> list[int | float]:
+    charges = [0] * sum(len(positions) for positions, _ in batches)
+    for positions, columns in batches:
+        for position, charge in zip(positions, rate_batch_values(*columns)):
+            charges[position] = charge
+    return charges
+
+
+def check_missing_values(seed: int = 10) -> int:
+    """Calls whose raw fields may be missing (None, NaN, "", "nan"): resolve_batch vs resolve_call, per client."""
+    rng = random.Random(seed)
+    missing = [None, float("nan"), "", "nan"]
+    disagreements = 0
+    for files in CONFIG:
+        tariff = tariff_for(files)
+        numbers = ["81234567890", "112", "scancall", *(str(number) for number in (files.number1, files.s2c) if number and not isinstance(number, list))]
+        rows = [
+            (
+                rng.choice(CALL_TYPES + missing),
+                rng.choice(["JABODETABEK", "Premium Call", "Singapore", "Internal call", "scancall", *missing]),
+                rng.choice(numbers + missing),
+                rng.choice(numbers + missing),
+            )
+            for _ in range(200)
+        ]
+        columns = [np.array(column, dtype=object) for column in zip(*rows)]
+        rate, per_second, _ = resolve_batch(tariff, *columns)
+        for row, batch_rate, batch_per_second in zip(rows, rate.tolist(), per_second.tolist()):
+            expected_rate, expected_type = tariff.resolve_call(*row)
+            if (float(expected_rate), expected_type == "per_second") != (batch_rate, batch_per_second):
+                disagreements += 1
+    return disagreements
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    calls = synthetic_calls(count)
+    print(f"{count:,} synthetic calls across {len(CONFIG)} clients")
+    expected = measure("if-chain", lambda calls: [if_chain_charge(call) for call in calls], calls)
+    actual = measure("compiled tariff", lambda calls: [call.calculate_call_charge() for call in calls], calls)
+    batched = measure("batch", rate_in_batches, client_batches(calls))
+    expected = [format_charge(charge) for charge in expected]
+    print(f"{sum(old != format_charge(new) for old, new in zip(expected, actual)):,} compiled charges differ from the if-chain")
+    print(f"{sum(old != format_charge(new) for old, new in zip(expected, batched)):,} batch charges differ from the if-chain")
+    print(f"{check_missing_values():,} batch rates differ from resolve_call on calls with missing fields")
+
+
+if __name__ == "__main__":
+    main()
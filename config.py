@@ -1,4 +1,4 @@
-from src.FileConfig import Files
+from src.FileConfig import Files, index_by_client
 from dataclasses import dataclass
 
 CONFIG: CONFIG = [
@@ -1410,4 +1410,7 @@ CONFIG: CONFIG = [
         chargeable_call_types=['outbound call', 'predictive dialer'],
     ),
     
-]
\ No newline at end of file
+]
+
+# Built once at import: client name -> Files entry.
+CLIENTS = index_by_client(CONFIG)
@@ -1,11 +1,91 @@
-from src.utils import parse_phone_number, parse_iso_datetime, parse_time_duration, parse_call_memo, classify_number
-from src.idn_area_codes import EMERGENCY_NUMBERS, INTERNATIONAL_PHONE_PREFIXES
 import math
-from src.utils import call_hash, classify_number, format_datetime_as_human_readable, format_timedelta, format_username, parse_call_memo, parse_iso_datetime, parse_phone_number
-from src.international_rates import INTERNATIONAL_RATES
-from config import CONFIG
+from src.utils import (
+    call_hash,
+    classify_number,
+    format_charge,
+    format_datetime_as_human_readable,
+    format_duration,
+    format_username,
+    from_epoch_seconds,
+    has_sequence_id,
+    parse_call_memo,
+    parse_iso_datetime,
+    parse_phone_number,
+    parse_time_duration,
+    to_epoch_seconds,
+)
+from src.tariff import FALLBACK_RATE, tariff_for
+from config import CLIENTS
+from src.FileConfig import Files
+from typing import Optional
+from datetime import timedelta
+
+
+class _Timestamp:
+    """datetime attribute stored as int epoch seconds plus a shared tzinfo."""
+
+    def __set_name__(self, owner, name):
+        self.seconds_slot = f"_{name}"
+        self.tz_slot = f"_{name}_tz"
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        return from_epoch_seconds(getattr(instance, self.seconds_slot), getattr(instance, self.tz_slot))
+
+    def __set__(self, instance, value):
+        seconds, tz = to_epoch_seconds(value)
+        setattr(instance, self.seconds_slot, seconds)
+        setattr(instance, self.tz_slot, tz)
+
+
+class _Duration:
+    """timedelta attribute stored as int seconds."""
+
+    def __set_name__(self, owner, name):
+        self.seconds_slot = f"_{name}"
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        return timedelta(seconds=getattr(instance, self.seconds_slot))
+
+    def __set__(self, instance, value):
+        setattr(instance, self.seconds_slot, int(value.total_seconds()))
+
 
 class CallDetail:
+    # Fixed slots instead of a per-instance __dict__; timestamps and durations are
+    # kept as int seconds and only turned into datetime/timedelta when read.
+    __slots__ = (
+        "client",
+        "_matched_client",
+        "sequence_id",
+        "user_name",
+        "call_from",
+        "call_to",
+        "call_type",
+        "_dial_start_at",
+        "_dial_start_at_tz",
+        "_dial_answered_at",
+        "_dial_answered_at_tz",
+        "_dial_end_at",
+        "_dial_end_at_tz",
+        "_ringing_time",
+        "_call_duration",
+        "call_memo",
+        "carrier",
+        "number_type",
+        "iso",
+        "call_charge",
+    )
+
+    dial_start_at = _Timestamp()
+    dial_answered_at = _Timestamp()
+    dial_end_at = _Timestamp()
+    ringing_time = _Duration()
+    call_duration = _Duration()
+
     def __init__(
         self,
         client:str,
@@ -20,11 +100,14 @@ class CallDetail:
         ringing_time: str,
         call_duration: str,
         call_memo: str,
-        call_charge: str,
+        call_charge: int | float | str,
         carrier: str,
         number_type: str = "",
+        client_config: Optional[Files] = None,
     ):
         self.client = client
+        # Callers that already resolved the client pass it in; otherwise look it up once.
+        self._matched_client = client_config if client_config is not None else CLIENTS.get(client)
         self.sequence_id = sequence_id
         self.user_name = user_name
         self.call_from = parse_phone_number(call_from)  # Normalizing here
@@ -40,146 +123,47 @@ class CallDetail:
         self.call_memo = parse_call_memo(call_memo)
         self.carrier = carrier
         self.number_type = number_type
-        self.iso = classify_number(self.call_to, self.call_type, self.call_from, self.call_to, self.number_type)
-        self.call_charge = self.calculate_call_charge()
+        # Classified and rated once all sources are merged, see finalize(); the
+        # exports' own charge is only a placeholder until then.
+        self.iso = None
+        self.call_charge = call_charge
+
+    def calculate_per_minute_charge(self, rate: float) -> int | float:
+        minutes = math.ceil(self.duration_seconds / 60)
+        return minutes * rate
 
-    def calculate_per_minute_charge(self, rate: float) -> str:
-        minutes = math.ceil(self.call_duration.total_seconds() / 60)
-        return str(minutes * rate)
+    def calculate_per_second_charge(self, rate: float) -> float:
+        return float(self.duration_seconds) * rate
 
-    def calculate_per_second_charge(self, rate: float) -> str:
-        return str(self.call_duration.total_seconds() * rate)
+    @property
+    def duration_seconds(self) -> int:
+        return self._call_duration
 
     @property
-    def matched_client(self):
-        if not hasattr(self, "_matched_client"):
-            self._matched_client = next(
-                (config_entry for config_entry in CONFIG if config_entry.client == self.client),
-                None
-            )
+    def matched_client(self) -> Optional[Files]:
         return self._matched_client
 
     @property
     def is_enduser(self):
         return self.matched_client is not None and "enduser" in self.matched_client.client.lower()
 
-    def _handle_number_charge(self, number, allowed_types, rate, rate_type, call_type, call_to, call_from):
-        if call_type in allowed_types and (call_to == number or call_from == number):
-            if rate == 0:
-                rate = 720
-            if rate_type == "per_minute":
-                return self.calculate_per_minute_charge(rate)
-            elif rate_type == "per_second":
-                return self.calculate_per_second_charge(rate)
-        return None
-
-    def calculate_call_charge(self) -> str:
-        SPECIAL_ZERO_CHARGE_CALLERS = {"2150913403", "85161662298", "85157455618", "82248400487", "2150913400", "2131141271"}
-        config = self.matched_client
+    def classify(self) -> str:
+        return classify_number(self.call_to, self.call_type, self.call_from, self.call_to, self.number_type)
 
-        call_to = str(self.call_to or "").strip()
-        call_from = str(self.call_from or "").strip()
-        call_type = (self.call_type or "").strip().lower()
-        iso = self.iso.lower() if self.iso else ""
-        chargeable_types = [ct.lower() for ct in config.chargeable_call_types] if config.chargeable_call_types else ["outbound call", "predictive dialer"]
+    def finalize(self) -> None:
+        """Classify and rate the call from its final, merged fields."""
+        self.iso = self.classify()
+        self.call_charge = self.calculate_call_charge()
 
+    def calculate_call_charge(self) -> int | float:
+        config = self.matched_client
         if not config:
-            return self.calculate_per_minute_charge(720)
+            return self.calculate_per_minute_charge(FALLBACK_RATE)
 
-        if call_from in SPECIAL_ZERO_CHARGE_CALLERS and self.matched_client and self.matched_client.client == "siemens-id":
-            return "0"
-
-        #Excluded number type
-        if iso == "internal call":
-            return self.calculate_per_minute_charge(0)
-
-        # Premium call handling
-        if iso in ["premium call", "toll-free", "split charge"] or iso in EMERGENCY_NUMBERS.values():
-            rate = 1700 + (200 if self.is_enduser else 0)
-            return self.calculate_per_minute_charge(rate)
-
-        # International call handling
-        carrier_key = config.carrier.title()  # Normalize the carrier name
-        rate_map = INTERNATIONAL_RATES.get(carrier_key, INTERNATIONAL_RATES["Atlasat"])
-
-        matched_key = next(
-            (k for k in rate_map if k.lower() in iso.lower() or iso.lower() in k.lower()),
-            None
-        )
-
-        if matched_key:
-            base_rate = rate_map[matched_key]
-            if self.is_enduser:
-                base_rate += 200
-            return self.calculate_per_minute_charge(base_rate)
-
-        # Specific number logic for S2C
-        s2c_target = call_to or call_from  # fallback if call_to is empty
-        #print(f"DEBUG: call_type={call_type}, iso={iso}, call_to={call_to}, call_from={call_from}, s2c_target={s2c_target}, config.s2c={config.s2c}")
-        s2c_list = config.s2c if isinstance(config.s2c, list) else [config.s2c]
-        if (s2c_target in s2c_list or iso == "scancall"):
-            #print(f"DEBUG: Matched S2C by number or type")
-
-            if call_type in ["incoming call", "answering machine"]:
-                if config.s2c_rate_type == "per_minute":
-                    return self.calculate_per_minute_charge(config.s2c_rate)
-                elif config.s2c_rate_type == "per_second":
-                    return self.calculate_per_second_charge(config.s2c_rate)
-
-            elif call_type in chargeable_types:
-                if config.s2c_rate_type == "per_minute":
-                    return self.calculate_per_minute_charge(config.s2c_rate)
-                elif config.s2c_rate_type == "per_second":
-                    return self.calculate_per_second_charge(config.s2c_rate)
-
-        number1_cts = [ct.lower() for ct in (config.number1_chargeable_call_types or [])]
-        result = self._handle_number_charge(
-            config.number1,
-            number1_cts,
-            config.number1_rate or 0,
-            config.number1_rate_type or "per_minute",
-            call_type,
-            call_to,
-            call_from
-        )
-        if result:
-            return result
-
-        number2_cts = [ct.lower() for ct in (config.number2_chargeable_call_types or [])]
-        result = self._handle_number_charge(
-            config.number2,
-            number2_cts,
-            config.number2_rate or 0,
-            config.number2_rate_type or "per_minute",
-            call_type,
-            call_to,
-            call_from
-        )
-        if result:
-            return result
-
-        # Otherwise, fallback to general chargeable_call_types (for all other calls)
-        allowed_types = [ct.lower() for ct in getattr(config, "chargeable_call_types", [])]
-        if not allowed_types or call_type in allowed_types:
-            rate_type = getattr(config, "rate_type", "per_minute")
-            rate = getattr(config, "rate", 0)
-            if rate_type == "per_minute":
-                return self.calculate_per_minute_charge(rate)
-            elif rate_type == "per_second":
-                return self.calculate_per_second_charge(rate)
-
-        # General chargeable logic
-        if call_type in chargeable_types:
-            if config.rate_type == "per_second":
-                return self.calculate_per_second_charge(config.rate if config.rate is not None else 720)
-            else:
-                return self.calculate_per_minute_charge(config.rate if config.rate is not None else 720)
-
-        # Excluded call types
-        if call_type not in chargeable_types:
-            return self.calculate_per_minute_charge(0)
-
-        return self.calculate_per_minute_charge(720)
+        rate, rate_type = tariff_for(config).resolve_call(self.call_type, self.iso, self.call_from, self.call_to)
+        if rate_type == "per_second":
+            return self.calculate_per_second_charge(rate)
+        return self.calculate_per_minute_charge(rate)
 
     def to_dict(self) -> dict:
         return {
@@ -189,30 +173,33 @@ class CallDetail:
             "Call to": self.call_to,
             "Call type": self.call_type,
             "Number type": self.number_type,
-            "ISO": classify_number(self.call_to, self.call_type, self.call_from, self.call_to, self.number_type),
+            "ISO": self.iso,
             "Dial starts at": format_datetime_as_human_readable(self.dial_start_at),
             "Dial answered at": format_datetime_as_human_readable(
                 self.dial_answered_at
             ),
             "Dial ends at": format_datetime_as_human_readable(self.dial_end_at),
-            "Ringing time": format_timedelta(self.ringing_time),
-            "Call duration": format_timedelta(self.call_duration),
+            "Ringing time": format_duration(self._ringing_time),
+            "Call duration": format_duration(self._call_duration),
             "Call memo": self.call_memo,
-            "Call charge": self.call_charge,
+            "Call charge": format_charge(self.call_charge),
         }
 
-    def hash_key(self) -> str:
+    def hash_key(self) -> Optional[str]:
         return call_hash(
             parse_phone_number(self.call_from),
             parse_phone_number(self.call_to),
-            self.dial_start_at,
+            to_epoch_seconds(self.dial_start_at)[0],
         )
 
     @property
-    def final_key(self) -> str:
+    def final_key(self) -> Optional[str]:
         """Preferred unique key for merging: 
         - Use sequence_id if available.
         - Else use call_id if present.
         - Else fallback to hash_key.
+        An ID read from an empty cell ("nan") counts as missing. None when
+        there is no start time either; callers then use unkeyed_call_key.
         """
-        return self.sequence_id or getattr(self, 'call_id', None) or self.hash_key()
+        sequence_id = self.sequence_id if has_sequence_id(self.sequence_id) else None
+        return sequence_id or getattr(self, 'call_id', None) or self.hash_key()
@@ -0,0 +1,392 @@
+from dataclasses import dataclass
+from datetime import timedelta, timezone
+from typing import Iterator, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from config import CLIENTS
+from src.CallDetail import CallDetail
+from src.utils import MISSING_SEQUENCE_IDS, from_epoch_seconds, to_epoch_seconds
+
+# Missing timestamps are stored as this sentinel (the same bit pattern as NaT).
+NULL_TIME = np.iinfo(np.int64).min
+
+# Per-field precedence rules for CallStore.upsert and CallStore.join, applied to keys already in the store.
+OVERWRITE = "overwrite"                        # the incoming value always wins
+OVERWRITE_IF_PRESENT = "overwrite_if_present"  # the incoming value wins unless it is empty
+FILL_EMPTY = "fill_empty"                      # the incoming value only fills an empty field
+KEEP = "keep"                                  # the stored value is never touched
+RULES = (OVERWRITE, OVERWRITE_IF_PRESENT, FILL_EMPTY, KEEP)
+
+TIMESTAMP_FIELDS = ("dial_start_at", "dial_answered_at", "dial_end_at")
+
+# name -> (dtype, value of a field that was never set)
+FIELDS = {
+    "sequence_id": (object, ""),
+    "user_name": (object, ""),
+    "call_from": (object, ""),
+    "call_to": (object, ""),
+    "call_type": (object, ""),
+    # UTC epoch seconds, plus the UTC offset the time was recorded in (0 for naive times).
+    "dial_start_at": (np.int64, NULL_TIME),
+    "dial_start_at_offset": (np.int32, 0),
+    "dial_answered_at": (np.int64, NULL_TIME),
+    "dial_answered_at_offset": (np.int32, 0),
+    "dial_end_at": (np.int64, NULL_TIME),
+    "dial_end_at_offset": (np.int32, 0),
+    "ringing_seconds": (np.int64, 0),
+    "duration_seconds": (np.int64, 0),
+    "call_memo": (object, "-"),
+    "number_type": (object, ""),
+    "iso": (object, None),
+    "call_charge": (object, 0),
+}
+
+_TIMEZONES: dict[int, Optional[timezone]] = {0: None}
+
+
+def _timezone(offset_seconds: int) -> Optional[timezone]:
+    if offset_seconds not in _TIMEZONES:
+        _TIMEZONES[offset_seconds] = timezone(timedelta(seconds=offset_seconds))
+    return _TIMEZONES[offset_seconds]
+
+
+def present_mask(name: str, values: np.ndarray) -> np.ndarray:
+    """Mask of non-empty values, with set_if_empty's notion of empty."""
+    if name in TIMESTAMP_FIELDS:
+        return values != NULL_TIME
+    if values.dtype == object:
+        return np.fromiter(map(bool, values), dtype=bool, count=len(values))
+    return values != 0
+
+
+def takes_incoming(rule: str, name: str, current: np.ndarray, incoming: np.ndarray) -> np.ndarray:
+    """Vectorized coalesce: rows where rule picks the incoming value over the current one."""
+    if rule == OVERWRITE:
+        return np.ones(len(incoming), dtype=bool)
+    if rule == KEEP:
+        return np.zeros(len(incoming), dtype=bool)
+    if rule == OVERWRITE_IF_PRESENT:
+        return present_mask(name, incoming)
+    if rule == FILL_EMPTY:
+        return present_mask(name, incoming) & ~present_mask(name, current)
+    raise ValueError(f"Unknown precedence rule: {rule}")
+
+
+def _field_group(name: str) -> list[str]:
+    """A field plus the columns that move with it (a timestamp's offset)."""
+    return [name, f"{name}_offset"] if name in TIMESTAMP_FIELDS else [name]
+
+
+@dataclass
+class JoinCounts:
+    matched: int
+    only_stored: int
+    only_incoming: int
+    # Matched calls that only paired up within the time tolerance (included in matched).
+    rescued: int = 0
+
+
+def _first_per_target(targets: np.ndarray) -> np.ndarray:
+    """Positions in targets of the first occurrence of each distinct value."""
+    return np.unique(targets, return_index=True)[1]
+
+
+def _last_per_target(targets: np.ndarray) -> np.ndarray:
+    """Positions in targets of the last occurrence of each distinct value."""
+    return len(targets) - 1 - np.unique(targets[::-1], return_index=True)[1]
+
+
+class CallStore:
+    """Merged calls of one client, stored column-wise.
+
+    Every field is a NumPy array (object arrays for text and phone numbers,
+    int64 epoch seconds for timestamps and durations) and a dict maps each
+    call's final key to its row. Rows keep insertion order, like the
+    dict[str, CallDetail] the processors used to pass around.
+    """
+
+    def __init__(self, client: str = "", carrier: str = "", capacity: int = 1024):
+        self.client = client
+        self.carrier = carrier
+        self.client_config = CLIENTS.get(client)
+        self._index: dict[str, int] = {}
+        self._size = 0
+        self._keys = np.empty(capacity, dtype=object)
+        self._columns = {name: np.full(capacity, default, dtype=dtype) for name, (dtype, default) in FIELDS.items()}
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, key) -> bool:
+        return key in self._index
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._index)
+
+    def keys(self) -> np.ndarray:
+        return self._keys[: self._size]
+
+    def column(self, name: str) -> np.ndarray:
+        """A writable view of one field for every stored call, in row order."""
+        return self._columns[name][: self._size]
+
+    def _reserve(self, size: int) -> None:
+        capacity = len(self._keys)
+        if size <= capacity:
+            return
+        capacity = max(size, 2 * capacity)
+        keys = np.empty(capacity, dtype=object)
+        keys[: self._size] = self._keys[: self._size]
+        self._keys = keys
+        for name, (dtype, default) in FIELDS.items():
+            grown = np.full(capacity, default, dtype=dtype)
+            grown[: self._size] = self._columns[name][: self._size]
+            self._columns[name] = grown
+
+    def upsert(
+        self,
+        keys: Sequence[str],
+        records: dict[str, Sequence],
+        rules: dict[str, str],
+        updates: Optional[dict[str, Sequence]] = None,
+    ) -> tuple[int, int]:
+        """Insert or update a batch of calls; returns (inserted calls, update rows).
+
+        records holds one array per field, aligned with keys. The first row of
+        a key that is not stored yet inserts every field in records; all other
+        rows update the stored call, field by field, following rules. Fields
+        without a rule are kept. updates, when given, supplies the values used
+        for those updates instead of records.
+
+        The result is the same as applying the rows one at a time in order.
+        """
+        unknown = set(rules.values()) - set(RULES)
+        if unknown:
+            raise ValueError(f"Unknown precedence rule: {', '.join(sorted(unknown))}")
+
+        keys = np.asarray(keys, dtype=object)
+        index = self._index
+        positions = np.fromiter((index.get(key, -1) for key in keys), dtype=np.int64, count=len(keys))
+
+        # New keys: number them in order of first appearance and insert their first row.
+        new_rows = np.flatnonzero(positions < 0)
+        codes, new_keys = pd.factorize(keys[new_rows])
+        insert_rows = new_rows[_first_per_target(codes)]
+        start = self._size
+        self._reserve(start + len(new_keys))
+        positions[new_rows] = start + codes
+        self._keys[start : start + len(new_keys)] = new_keys
+        index.update(zip(new_keys, range(start, start + len(new_keys))))
+        for name, values in records.items():
+            self._columns[name][start : start + len(new_keys)] = np.asarray(values)[insert_rows]
+        self._size += len(new_keys)
+
+        # Everything else is an update to a stored call, applied in batch order.
+        is_update = np.ones(len(keys), dtype=bool)
+        is_update[insert_rows] = False
+        update_rows = np.flatnonzero(is_update)
+        if len(update_rows):
+            source = records if updates is None else updates
+            targets = positions[update_rows]
+            for name, rule in rules.items():
+                values = {field: np.asarray(source[field])[update_rows] for field in _field_group(name)}
+                self._apply_rule(rule, name, targets, values)
+        return len(new_keys), len(update_rows)
+
+    def _apply_rule(self, rule: str, name: str, targets: np.ndarray, values: dict[str, np.ndarray]) -> None:
+        if rule == KEEP:
+            return
+        if rule == OVERWRITE:
+            rows = _last_per_target(targets)
+        else:
+            present = np.flatnonzero(present_mask(name, values[name]))
+            if rule == OVERWRITE_IF_PRESENT:
+                rows = present[_last_per_target(targets[present])]
+            else:  # FILL_EMPTY
+                rows = present[_first_per_target(targets[present])]
+                rows = rows[~present_mask(name, self._columns[name][targets[rows]])]
+        for field, field_values in values.items():
+            self._columns[field][targets[rows]] = field_values[rows]
+
+    def join(
+        self,
+        keys: Sequence[str],
+        records: dict[str, Sequence],
+        rules: dict[str, str],
+        updates: Optional[dict[str, Sequence]] = None,
+        tolerance_seconds: Optional[int] = None,
+    ) -> JoinCounts:
+        """upsert as one outer join between the stored calls and the batch.
+
+        Repeated keys within the batch are collapsed first (with the same
+        rules), then every field is coalesced column-wise. Calls only in the
+        store keep their position; calls only in the batch follow them in
+        order of first appearance.
+
+        With tolerance_seconds, calls left unmatched on both sides that have
+        no sequence ID (so their key is the exact call_hash) are paired up
+        when from and to agree and the start times are at most that far apart.
+        """
+        incoming = CallStore(self.client, self.carrier, capacity=max(len(keys), 1))
+        incoming.upsert(keys, records, rules, updates)
+
+        joined = pd.merge(
+            pd.DataFrame({"final_key": self.keys(), "stored_row": np.arange(len(self))}),
+            pd.DataFrame({"final_key": incoming.keys(), "incoming_row": np.arange(len(incoming))}),
+            on="final_key",
+            how="outer",
+        )
+        stored_row = joined["stored_row"].fillna(-1).to_numpy(dtype=np.int64)
+        incoming_row = joined["incoming_row"].fillna(-1).to_numpy(dtype=np.int64)
+        order = np.argsort(np.where(stored_row >= 0, stored_row, len(self) + incoming_row), kind="stable")
+        stored_row, incoming_row = stored_row[order], incoming_row[order]
+
+        rescued = 0
+        if tolerance_seconds is not None:
+            pairs_stored, pairs_incoming = self._near_matches(
+                incoming, stored_row[incoming_row < 0], incoming_row[stored_row < 0], tolerance_seconds
+            )
+            rescued = len(pairs_stored)
+            if rescued:
+                # The batch's call is folded into the stored one, which keeps its key and position.
+                joined_position = np.empty(len(self), dtype=np.int64)
+                joined_position[stored_row[stored_row >= 0]] = np.flatnonzero(stored_row >= 0)
+                keep = ~((stored_row < 0) & np.isin(incoming_row, pairs_incoming))
+                incoming_row[joined_position[pairs_stored]] = pairs_incoming
+                stored_row, incoming_row = stored_row[keep], incoming_row[keep]
+
+        has_stored, has_incoming = stored_row >= 0, incoming_row >= 0
+        counts = JoinCounts(
+            matched=int((has_stored & has_incoming).sum()),
+            only_stored=int((~has_incoming).sum()),
+            only_incoming=int((~has_stored).sum()),
+            rescued=rescued,
+        )
+
+        columns = {}
+        for name in FIELDS:
+            if name.endswith("_offset"):
+                continue
+            current = self._columns[name][stored_row]
+            candidate = incoming._columns[name][incoming_row]
+            take = ~has_stored | (has_incoming & takes_incoming(rules.get(name, KEEP), name, current, candidate))
+            for field in _field_group(name):
+                columns[field] = np.where(take, incoming._columns[field][incoming_row], self._columns[field][stored_row])
+
+        keys = np.where(has_stored, self._keys[stored_row], incoming._keys[incoming_row])
+        self._keys, self._columns, self._size = keys, columns, len(keys)
+        self._index = dict(zip(keys, range(len(keys))))
+        return counts
+
+    def _near_matches(
+        self, incoming: "CallStore", stored_rows: np.ndarray, incoming_rows: np.ndarray, tolerance_seconds: int
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """(stored rows, incoming rows) paired by an as-of join on start time within the tolerance.
+
+        Both sides are sorted by start time and pd.merge_asof finds, per
+        incoming call, the nearest stored call with the same from and to, so
+        the whole stage is O(n log n). A stored call is paired at most once;
+        the closest incoming call wins.
+        """
+
+        def candidates(store: "CallStore", rows: np.ndarray, row_column: str) -> pd.DataFrame:
+            columns = store._columns
+            # Only calls keyed by call_hash, and that have a start time to compare.
+            rows = rows[pd.Series(columns["sequence_id"][rows]).isin(MISSING_SEQUENCE_IDS).to_numpy()]
+            rows = rows[columns["dial_start_at"][rows] != NULL_TIME]
+            frame = pd.DataFrame(
+                {
+                    "call_from": pd.Series(columns["call_from"][rows], dtype=object).astype(str),
+                    "call_to": pd.Series(columns["call_to"][rows], dtype=object).astype(str),
+                    "start": columns["dial_start_at"][rows],
+                    row_column: rows,
+                }
+            )
+            return frame.sort_values("start", kind="stable")
+
+        empty = np.empty(0, dtype=np.int64)
+        left = candidates(incoming, incoming_rows, "incoming_row")
+        right = candidates(self, stored_rows, "stored_row")
+        if left.empty or right.empty:
+            return empty, empty
+
+        paired = pd.merge_asof(
+            left,
+            right.assign(stored_start=right["start"]),
+            on="start",
+            by=["call_from", "call_to"],
+            tolerance=int(tolerance_seconds),
+            direction="nearest",
+        ).dropna(subset=["stored_row"])
+        paired["gap"] = (paired["start"] - paired["stored_start"]).abs()
+        paired = paired.sort_values(["gap", "incoming_row"], kind="stable").drop_duplicates("stored_row")
+        return paired["stored_row"].to_numpy(dtype=np.int64), paired["incoming_row"].to_numpy(dtype=np.int64)
+
+    def timestamps(self, name: str) -> list:
+        """One timestamp field as datetimes (None when missing), in the offset each was recorded in."""
+        return [
+            from_epoch_seconds(None if seconds == NULL_TIME else int(seconds), _timezone(int(offset)))
+            for seconds, offset in zip(self.column(name), self.column(f"{name}_offset"))
+        ]
+
+    @classmethod
+    def from_call_details(cls, call_details: dict[str, CallDetail], client: str = "", carrier: str = "") -> "CallStore":
+        """A store holding the same calls as a dict[str, CallDetail], in the same order."""
+        calls = list(call_details.values())
+        store = cls(client, carrier, capacity=max(len(calls), 1))
+        text_fields = [name for name, (dtype, _) in FIELDS.items() if dtype is object]
+        records = {name: np.array([getattr(call, name) for call in calls], dtype=object) for name in text_fields}
+        records["ringing_seconds"] = np.array([call.ringing_time // timedelta(seconds=1) for call in calls], dtype=np.int64)
+        records["duration_seconds"] = np.array([call.duration_seconds for call in calls], dtype=np.int64)
+        for name in TIMESTAMP_FIELDS:
+            seconds = np.full(len(calls), NULL_TIME, dtype=np.int64)
+            offsets = np.zeros(len(calls), dtype=np.int32)
+            for position, call in enumerate(calls):
+                value = getattr(call, name)
+                if value is not None:
+                    seconds[position] = to_epoch_seconds(value)[0]
+                    offsets[position] = value.utcoffset() // timedelta(seconds=1) if value.tzinfo else 0
+            records[name], records[f"{name}_offset"] = seconds, offsets
+        store.upsert(list(call_details), records, {})
+        return store
+
+    def call_detail(self, key: str) -> CallDetail:
+        """Build a CallDetail for one stored call."""
+        row = self._index[key]
+        columns = self._columns
+
+        def timestamp(name: str):
+            seconds = columns[name][row]
+            if seconds == NULL_TIME:
+                return None
+            return from_epoch_seconds(int(seconds), _timezone(int(columns[f"{name}_offset"][row])))
+
+        call_detail = CallDetail(
+            client=self.client,
+            sequence_id=columns["sequence_id"][row],
+            user_name=columns["user_name"][row],
+            call_from=columns["call_from"][row],
+            call_to=columns["call_to"][row],
+            call_type=columns["call_type"][row],
+            dial_start_at=timestamp("dial_start_at"),
+            dial_answered_at=timestamp("dial_answered_at"),
+            dial_end_at=timestamp("dial_end_at"),
+            ringing_time=timedelta(seconds=int(columns["ringing_seconds"][row])),
+            call_duration=timedelta(seconds=int(columns["duration_seconds"][row])),
+            call_memo=columns["call_memo"][row],
+            call_charge=columns["call_charge"][row],
+            carrier=self.carrier,
+            number_type=columns["number_type"][row],
+            client_config=self.client_config,
+        )
+        call_detail.iso = columns["iso"][row]
+        return call_detail
+
+    def to_frame(self, start: int = 0, stop: Optional[int] = None) -> pd.DataFrame:
+        """Stored calls (all, or rows start:stop) as a DataFrame whose columns are views of the store's arrays."""
+        rows = slice(start, self._size if stop is None else min(stop, self._size))
+        data = {"final_key": self._keys[rows]}
+        data.update((name, self._columns[name][rows]) for name in FIELDS)
+        return pd.DataFrame(data, copy=False)
@@ -1,5 +1,5 @@
 from dataclasses import dataclass, field
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 @dataclass
 class Files:
@@ -28,4 +28,15 @@ class Files:
 
     #General
     chargeable_call_types: List[str] = field(default_factory=list)
-    #custom_logic: Optional[str] = None
\ No newline at end of file
+
+    # pbx_region of the client's PBX: dashboard times are wall-clock time there.
+    pbx_region: str = "jkt"
+    #custom_logic: Optional[str] = None
+
+
+def index_by_client(config: List[Files]) -> Dict[str, Files]:
+    """Map client name to its Files entry. The first entry wins, as a linear search would."""
+    index: Dict[str, Files] = {}
+    for files in config:
+        index.setdefault(files.client, files)
+    return index
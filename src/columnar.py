@@ -0,0 +1,539 @@
+from collections.abc import MutableMapping
+from datetime import datetime, timedelta, timezone, tzinfo
+from typing import Iterator, Optional
+
+import numpy as np
+import pandas as pd
+
+from config import CLIENTS
+from src.CallDetail import CallDetail
+from src.CallStore import NULL_TIME
+from src.utils import (
+    MISSING_SEQUENCE_IDS,
+    PBX_REGION_UTC_OFFSETS,
+    call_hash,
+    from_epoch_seconds,
+    localize,
+    parse_call_memo,
+    parse_iso_datetime,
+    parse_phone_number,
+    parse_time_duration,
+    print_unkeyed_rows,
+    set_if_empty,
+    to_epoch_seconds,
+    unkeyed_call_key,
+    unsupported_region,
+)
+
+# Characters parse_phone_number strips.
+PHONE_PUNCTUATION = "+-() "
+# Longer values, and numbers of more digits, are left to parse_phone_number.
+PHONE_MAX_CHARS = 32
+PHONE_MAX_DIGITS = 18
+ISO_DATETIME_PATTERN = r"^\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}$"
+DURATION_PATTERN = r"^\d{1,9}:\d{1,9}:\d{1,9}$"
+# Byte positions of "YYYY-MM-DD HH:MM:SS".
+DATETIME_SEPARATORS = {4: "-", 7: "-", 10: " ", 13: ":", 16: ":"}
+DATETIME_DIGITS = [position for position in range(19) if position not in DATETIME_SEPARATORS]
+PANDAS_TIMESTAMP_SECONDS = np.iinfo(np.int64).max // 10**9
+DAYS_IN_MONTH = np.array([0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31], dtype=np.int64)
+
+
+def normalize_phone_numbers(values) -> tuple[np.ndarray, np.ndarray]:
+    """Batch parse_phone_number: (int64 numbers, validity mask) for a Series or array of strings.
+
+    Each distinct value is handled once, all of them together as a matrix of
+    ASCII bytes: punctuation is dropped, the first two remaining characters
+    decide whether a "62" or "0" prefix goes, and the digits after it are read
+    as one int64.
+    Values that do not come out as a plain number of at most 18 digits (e.g.
+    "scancall", "nan", letters or non-ASCII digits) are marked invalid; their
+    number is 0 and parse_phone_number has the final word on them.
+    """
+    text = pd.Series(values, copy=False).astype(str)
+    if "\x00" in "".join(text.tolist()):
+        # pandas hashes strings only up to a NUL, and NumPy takes NUL for padding: keep those rows out.
+        clean = np.fromiter(("\x00" not in value for value in text), dtype=bool, count=len(text))
+        numbers, valid = np.zeros(len(text), dtype=np.int64), np.zeros(len(text), dtype=bool)
+        numbers[clean], valid[clean] = normalize_phone_numbers(text[clean])
+        return numbers, valid
+
+    # Exports repeat the same numbers over and over: normalize each distinct value once.
+    positions, strings = pd.factorize(text)
+    numbers, valid = _normalize_distinct_phones(np.asarray(strings, dtype=object))
+    return numbers[positions], valid[positions]
+
+
+def _normalize_distinct_phones(strings: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    count = len(strings)
+    valid = np.ones(count, dtype=bool)
+    try:
+        strings = strings.astype(bytes)
+    except UnicodeEncodeError:
+        ascii = np.fromiter((value.isascii() for value in strings), dtype=bool, count=count)
+        valid &= ascii
+        strings = np.where(ascii, strings, "").astype(bytes)
+    width = strings.dtype.itemsize
+    if count == 0 or width == 0:
+        return np.zeros(count, dtype=np.int64), np.zeros(count, dtype=bool)
+    codes = strings.view(np.uint8).reshape(count, width)
+    if width > PHONE_MAX_CHARS:
+        valid &= codes[:, PHONE_MAX_CHARS] == 0
+        codes = codes[:, :PHONE_MAX_CHARS]
+
+    punctuation = np.zeros(codes.shape, dtype=bool)
+    for char in PHONE_PUNCTUATION:
+        punctuation |= codes == ord(char)
+    kept = (codes != 0) & ~punctuation
+    digit = (codes >= ord("0")) & (codes <= ord("9"))
+    valid &= ~(kept & ~digit).any(axis=1)
+    # rank: how many kept characters up to and including each position.
+    rank = np.cumsum(kept, axis=1, dtype=np.uint8)
+    kept_total = rank[:, -1]
+    rows = np.arange(count)
+    first = codes[rows, np.argmax(rank == 1, axis=1)]
+    second = codes[rows, np.argmax(rank == 2, axis=1)]
+    skip = np.where((first == ord("6")) & (second == ord("2")) & (kept_total >= 2), 2, np.where(first == ord("0"), 1, 0))
+    # int("") fails: at least one digit has to be left after the prefix.
+    valid &= kept_total > skip
+
+    counted = kept & (rank > skip[:, None].astype(np.uint8))
+    nonzero = counted & (codes != ord("0"))
+    leading = rank[rows, np.argmax(nonzero, axis=1)]
+    significant_digits = np.where(nonzero.any(axis=1), kept_total.astype(np.int64) - leading + 1, 0)
+    valid &= significant_digits <= PHONE_MAX_DIGITS
+
+    counted &= valid[:, None]
+    multipliers = np.ascontiguousarray(np.where(counted, np.uint8(10), np.uint8(1)).T)
+    digits = np.ascontiguousarray(np.where(counted, codes - np.uint8(ord("0")), np.uint8(0)).T)
+    numbers = np.zeros(count, dtype=np.int64)
+    for multiplier, digit_values in zip(multipliers, digits):
+        numbers *= multiplier
+        numbers += digit_values
+    return numbers, valid
+
+
+def normalize_phone_column(values: pd.Series) -> pd.Series:
+    """Whole-column version of parse_phone_number.
+
+    Plain numbers come from normalize_phone_numbers; anything it marks
+    invalid goes through the scalar function, so the result is identical to
+    calling parse_phone_number row by row.
+    """
+    values = values.astype(str)
+    numbers, valid = normalize_phone_numbers(values)
+    result = numbers.astype(object)
+    if not valid.all():
+        result[~valid] = values[~valid].map(parse_phone_number).to_numpy(dtype=object)
+    return pd.Series(result, index=values.index)
+
+
+def normalize_phone_again(values: pd.Series) -> np.ndarray:
+    """parse_phone_number over already normalized numbers: a no-op on ints, so only text is parsed again."""
+    result = values.to_numpy(dtype=object).copy()
+    text = np.fromiter((not isinstance(value, int) for value in result), dtype=bool, count=len(result))
+    if text.any():
+        result[text] = [parse_phone_number(value) for value in result[text]]
+    return result
+
+
+def parse_iso_datetime_column(values: pd.Series) -> pd.Series:
+    """Whole-column version of parse_iso_datetime ("-" becomes NaT)."""
+    values = values.astype(str)
+    missing = values == "-"
+    present = values[~missing]
+    if present.str.fullmatch(ISO_DATETIME_PATTERN).all():
+        parsed = pd.to_datetime(present.str.replace("T", " ", regex=False), format="%Y-%m-%d %H:%M:%S")
+    else:
+        # Offsets or fractional seconds: fall back to fromisoformat per distinct value.
+        unique_values = present.unique()
+        lookup = {value: parse_iso_datetime(value) for value in unique_values}
+        parsed = present.map(lookup)
+    return parsed.reindex(values.index)
+
+
+def parse_duration_column(values: pd.Series) -> pd.Series:
+    """Whole-column version of parse_time_duration, returned as int64 seconds."""
+    values = values.astype(str)
+    well_formed = values.str.fullmatch(DURATION_PATTERN)
+    seconds = pd.Series(np.zeros(len(values), dtype=np.int64), index=values.index)
+    if well_formed.any():
+        parts = values[well_formed].str.split(":", expand=True).astype(np.int64)
+        seconds[well_formed] = parts[0] * 3600 + parts[1] * 60 + parts[2]
+    if (~well_formed).any():
+        seconds[~well_formed] = [
+            int(parse_time_duration(value).total_seconds()) for value in values[~well_formed]
+        ]
+    return seconds
+
+
+def to_python_datetime(value):
+    if value is None or pd.isna(value):
+        return None
+    return value.to_pydatetime() if isinstance(value, pd.Timestamp) else value
+
+
+def localize_column(values: pd.Series, local_timezone: tzinfo) -> pd.Series:
+    """Whole-column localize over parse_iso_datetime_column's result."""
+    if pd.api.types.is_datetime64_dtype(values.dtype):
+        return values.dt.tz_localize(local_timezone)
+    return values.map(lambda value: localize(to_python_datetime(value), local_timezone)).astype(object)
+
+
+def read_dashboard_frame(df: pd.DataFrame, local_timezone: tzinfo) -> pd.DataFrame:
+    """Normalize a dashboard export (read with DASHBOARD_SCHEMA) into typed columns plus final_key.
+
+    Dashboard times are wall-clock times of the client's PBX (local_timezone),
+    so the same call gets the same UTC start, and key, as on the console.
+    """
+    frame = pd.DataFrame(
+        {
+            "sequence_id": df["Sequence ID"],
+            "user_name": df["User name"],
+            "call_from": normalize_phone_column(df["Call from"]),
+            "call_to": normalize_phone_column(df["Call to"]),
+            "call_type": df["Call type"],
+            "dial_start_at": localize_column(parse_iso_datetime_column(df["Dial begin time"]), local_timezone),
+            "dial_answered_at": localize_column(parse_iso_datetime_column(df["Call begin time"]), local_timezone),
+            "dial_end_at": localize_column(parse_iso_datetime_column(df["Call end time"]), local_timezone),
+            "ringing_seconds": df["Ringing time"],
+            "duration_seconds": df["Call duration"],
+            "call_memo": df["Call memo"],
+        }
+    )
+    return add_final_key(frame, "dashboard")
+
+
+def add_final_key(frame: pd.DataFrame, source: str) -> pd.DataFrame:
+    """Add CallDetail.final_key as a column: the sequence ID, or call_hash when it is missing.
+
+    Rows with no start time either are keyed by unkeyed_call_key(source, row).
+    """
+    final_key = frame["sequence_id"].copy()
+    needs_hash = final_key.isin(MISSING_SEQUENCE_IDS)
+    if needs_hash.any():
+        rows = frame[needs_hash]
+        if "dial_start_at_offset" in frame:
+            seconds = rows["dial_start_at"].to_numpy()
+        else:
+            seconds, _ = epoch_seconds_column(rows["dial_start_at"])
+        final_key[needs_hash] = [
+            call_hash(
+                parse_phone_number(parse_phone_number(call_from)),
+                parse_phone_number(parse_phone_number(call_to)),
+                start,
+            )
+            if start != NULL_TIME
+            else unkeyed_call_key(source, row)
+            for row, call_from, call_to, start in zip(rows.index, rows["call_from"], rows["call_to"], seconds.tolist())
+        ]
+        print_unkeyed_rows(int((seconds == NULL_TIME).sum()), source)
+    frame["final_key"] = final_key
+    return frame
+
+
+def utc_epoch_column(values: pd.Series) -> tuple[np.ndarray, np.ndarray]:
+    """(UTC epoch seconds, missing mask) for "YYYY-MM-DD HH:MM:SS" text; "nan" is missing.
+
+    The fixed layout is read straight from the bytes of the whole column.
+    Anything that does not fit it exactly goes through datetime.strptime, so
+    malformed values fail the way parse_jakarta_datetime does.
+    """
+    text = values.astype(str)
+    seconds = np.full(len(text), NULL_TIME, dtype=np.int64)
+    try:
+        raw = text.to_numpy(dtype=object).astype("S20")
+    except UnicodeEncodeError:
+        raw = np.array([value.encode("ascii", "replace")[:20] for value in text], dtype="S20")
+    missing = raw == b"nan"
+    codes = raw.view(np.uint8).reshape(len(raw), 20)
+    # Exactly 19 characters: separators where they belong, digits everywhere else.
+    well_formed = ~missing & (codes[:, 18] != 0) & (codes[:, 19] == 0)
+    for position, separator in DATETIME_SEPARATORS.items():
+        well_formed &= codes[:, position] == ord(separator)
+    digits = codes[:, DATETIME_DIGITS]
+    well_formed &= ((digits >= ord("0")) & (digits <= ord("9"))).all(axis=1)
+
+    def number(start: int, length: int) -> np.ndarray:
+        result = np.zeros(len(codes), dtype=np.int64)
+        for position in range(start, start + length):
+            result = result * 10 + codes[:, position] - ord("0")
+        return result
+
+    year, month, day = number(0, 4), number(5, 2), number(8, 2)
+    hour, minute, second = number(11, 2), number(14, 2), number(17, 2)
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    month_days = DAYS_IN_MONTH[np.clip(month, 1, 12)] + ((month == 2) & leap)
+    well_formed &= (year >= 1) & (month >= 1) & (month <= 12) & (day >= 1) & (day <= month_days)
+    well_formed &= (hour <= 23) & (minute <= 59) & (second <= 59)
+
+    # Days since 1970-01-01 of a proleptic Gregorian date (civil-from-days inverted).
+    shifted_year = year - (month <= 2)
+    era = shifted_year // 400
+    year_of_era = shifted_year - era * 400
+    day_of_year = (153 * (month + np.where(month > 2, -3, 9)) + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    days = era * 146097 + day_of_era - 719468
+    seconds[well_formed] = (days * 86400 + hour * 3600 + minute * 60 + second)[well_formed]
+
+    for position in np.flatnonzero(~missing & ~well_formed):
+        parsed = datetime.strptime(text.iat[position], "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+        seconds[position] = to_epoch_seconds(parsed)[0]
+    return seconds, missing
+
+
+def region_offset_column(regions: pd.Series, needed: np.ndarray) -> np.ndarray:
+    """UTC offsets (int32 seconds) of each row's pbx_region; an unknown region raises where needed is set."""
+    codes, names = pd.factorize(regions.astype(str))
+    known = np.array([name in PBX_REGION_UTC_OFFSETS for name in names], dtype=bool)
+    unknown = needed & ~known[codes] if len(names) else np.zeros(len(codes), dtype=bool)
+    if unknown.any():
+        raise unsupported_region(regions.iloc[int(np.argmax(unknown))])
+    table = np.array([PBX_REGION_UTC_OFFSETS.get(name, 0) for name in names], dtype=np.int32)
+    return table[codes] if len(names) else np.zeros(len(codes), dtype=np.int32)
+
+
+def local_epoch_column(values: pd.Series, regions: pd.Series) -> tuple[np.ndarray, np.ndarray]:
+    """Whole-column parse_jakarta_datetime, as CallStore stores it: (UTC epoch seconds, UTC offset seconds).
+
+    Missing ("nan") values become NULL_TIME; their region is not checked.
+    """
+    seconds, missing = utc_epoch_column(values)
+    return seconds, region_offset_column(regions, ~missing)
+
+
+def local_datetimes(seconds: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """Aware datetimes (None for NULL_TIME) for epoch seconds and their UTC offsets."""
+    result = np.full(len(seconds), None, dtype=object)
+    present = seconds != NULL_TIME
+    # pandas timestamps only span the years 1677-2262; anything outside is converted one by one.
+    in_range = present & (np.abs(seconds) < PANDAS_TIMESTAMP_SECONDS)
+    for offset in np.unique(offsets[present]):
+        tz = timezone(timedelta(seconds=int(offset)))
+        rows = in_range & (offsets == offset)
+        result[rows] = pd.to_datetime(seconds[rows], unit="s", utc=True).tz_convert(tz).to_pydatetime()
+        for position in np.flatnonzero(present & ~in_range & (offsets == offset)):
+            result[position] = from_epoch_seconds(int(seconds[position]), tz)
+    return result
+
+
+def read_console_frame(df: pd.DataFrame, call_type_mapping: dict[str, str]) -> pd.DataFrame:
+    """Normalize a console export (read with CONSOLE_SCHEMA) into the columns of read_dashboard_frame."""
+    frame = pd.DataFrame(
+        {
+            "sequence_id": df["call_id"],
+            "user_name": "-",
+            "call_from": normalize_phone_column(df["used_number"]),
+            "call_to": normalize_phone_column(df["number"]),
+            "call_type": df["call_type"].map(lambda call_type: call_type_mapping.get(call_type, call_type)),
+            "ringing_seconds": df["all_duration_of_call_sec_str"],
+            "duration_seconds": df["duration_of_call_sec_str"],
+            "call_memo": "",
+            "number_type": df["number_type"],
+        },
+        index=df.index,
+    )
+    # Console times stay epoch seconds plus offset, the way call_records hands them to the store.
+    for name, column in (
+        ("dial_start_at", "dial_starts_at"),
+        ("dial_answered_at", "dial_answered_at"),
+        ("dial_end_at", "dial_ends_at"),
+    ):
+        frame[name], frame[f"{name}_offset"] = local_epoch_column(df[column], df["pbx_region"])
+    return add_final_key(frame, "console")
+
+
+def read_merged_frame(df: pd.DataFrame, local_timezone: tzinfo) -> pd.DataFrame:
+    """Normalize a merged export (read with MERGED_SCHEMA) into the columns of read_dashboard_frame.
+
+    Its times are wall-clock times in local_timezone, as save_merged_csv writes them.
+    """
+    missing = pd.Series("", index=df.index)
+    call_id = df["call_id"] if "call_id" in df else missing
+    sequence_id = call_id.where(call_id != "", df["Sequence ID"] if "Sequence ID" in df else missing)
+    frame = pd.DataFrame(
+        {
+            "sequence_id": sequence_id,
+            "user_name": df["User name"],
+            "call_from": normalize_phone_column(df["Call from"]),
+            "call_to": normalize_phone_column(df["Call to"]),
+            "call_type": df["Call type"],
+            "dial_start_at": localize_column(parse_iso_datetime_column(df["Dial starts at"]), local_timezone),
+            "dial_answered_at": localize_column(parse_iso_datetime_column(df["Dial answered at"]), local_timezone),
+            "dial_end_at": localize_column(parse_iso_datetime_column(df["Dial ends at"]), local_timezone),
+            "ringing_seconds": df["Ringing time"],
+            "duration_seconds": df["Call duration"],
+            "call_memo": df["Call memo"],
+        },
+        index=df.index,
+    )
+    return add_final_key(frame, "merged")
+
+
+def epoch_seconds_column(values: pd.Series) -> tuple[np.ndarray, np.ndarray]:
+    """(UTC epoch seconds, UTC offset seconds) for a datetime column; missing values become NULL_TIME."""
+    if isinstance(values.dtype, pd.DatetimeTZDtype) or pd.api.types.is_datetime64_dtype(values.dtype):
+        offsets = np.zeros(len(values), dtype=np.int32)
+        if isinstance(values.dtype, pd.DatetimeTZDtype):
+            offsets[:] = int(values.dt.tz.utcoffset(None).total_seconds())
+            values = values.dt.tz_convert("UTC").dt.tz_localize(None)
+        nanoseconds = values.to_numpy(dtype="datetime64[ns]").view(np.int64)
+        seconds = np.where(values.isna().to_numpy(), NULL_TIME, nanoseconds // 10**9)
+        return seconds, offsets
+
+    # Mixed or offset-carrying values parsed one by one (see parse_iso_datetime_column).
+    seconds = np.full(len(values), NULL_TIME, dtype=np.int64)
+    offsets = np.zeros(len(values), dtype=np.int32)
+    for position, value in enumerate(values):
+        value = to_python_datetime(value)
+        if value is None:
+            continue
+        seconds[position] = to_epoch_seconds(value)[0]
+        if value.tzinfo is not None:
+            offsets[position] = int(value.utcoffset().total_seconds())
+    return seconds, offsets
+
+
+def call_records(frame: pd.DataFrame) -> dict[str, np.ndarray]:
+    """CallStore field arrays for a frame from one of the read_*_frame functions."""
+    records = {
+        "sequence_id": frame["sequence_id"].to_numpy(dtype=object),
+        "user_name": frame["user_name"].to_numpy(dtype=object),
+        # CallDetail normalizes the numbers it is given once more; so does the store.
+        "call_from": normalize_phone_again(frame["call_from"]),
+        "call_to": normalize_phone_again(frame["call_to"]),
+        "call_type": frame["call_type"].to_numpy(dtype=object),
+        "ringing_seconds": frame["ringing_seconds"].to_numpy(dtype=np.int64),
+        "duration_seconds": frame["duration_seconds"].to_numpy(dtype=np.int64),
+        "call_memo": frame["call_memo"].map(parse_call_memo).to_numpy(dtype=object),
+    }
+    for name in ("dial_start_at", "dial_answered_at", "dial_end_at"):
+        if f"{name}_offset" in frame:
+            records[name] = frame[name].to_numpy(dtype=np.int64)
+            records[f"{name}_offset"] = frame[f"{name}_offset"].to_numpy(dtype=np.int32)
+        else:
+            records[name], records[f"{name}_offset"] = epoch_seconds_column(frame[name])
+    if "number_type" in frame:
+        records["number_type"] = frame["number_type"].to_numpy(dtype=object)
+    return records
+
+
+def format_timestamp_column(seconds: np.ndarray, offsets: np.ndarray) -> pd.Series:
+    """Whole-column format_datetime_as_human_readable over CallStore timestamps ("-" when missing)."""
+    missing = seconds == NULL_TIME
+    local = pd.Series(pd.to_datetime(np.where(missing, 0, seconds + offsets), unit="s"))
+    return local.dt.strftime("%Y-%m-%d %H:%M:%S").mask(missing, "-")
+
+
+def format_duration_column(seconds: np.ndarray) -> pd.Series:
+    """Whole-column format_timedelta over int seconds ("H:MM:SS", whole days dropped the same way)."""
+    seconds = pd.Series(seconds % 86400)
+    hours, minutes, rest = seconds // 3600, seconds // 60 % 60, seconds % 60
+    return hours.astype(str) + ":" + minutes.astype(str).str.zfill(2) + ":" + rest.astype(str).str.zfill(2)
+
+
+class ColumnarCallDetails(MutableMapping):
+    """dict[str, CallDetail] view over a collapsed dashboard frame.
+
+    One row per final_key is kept; CallDetail objects are only built (and
+    rated) when a key is looked up or the values are iterated, so the console
+    pass only pays for the calls it actually touches.
+    """
+
+    def __init__(self, frame: pd.DataFrame, client: str, carrier: str):
+        self.client = client
+        self.client_config = CLIENTS.get(client)
+        self.carrier = carrier
+
+        keys = frame["final_key"]
+        first = ~keys.duplicated(keep="first")
+        self._rows = list(frame[first].itertuples(index=False))
+        self._positions = {row.final_key: position for position, row in enumerate(self._rows)}
+
+        # Later dashboard rows for the same key only touch user name, memo and call_to.
+        self._patches: dict[str, dict] = {}
+        for row in frame[~first].itertuples():
+            patch = self._patches.setdefault(row.final_key, {})
+            patch["user_name"] = row.user_name
+            patch["call_memo"] = row.call_memo
+            patch.setdefault("call_to", []).append(parse_phone_number(row.call_to))
+
+        self._materialized: dict[str, CallDetail] = {}
+        self._extra: dict[str, CallDetail] = {}
+
+    def _build(self, key: str) -> CallDetail:
+        row = self._rows[self._positions[key]]
+        call_detail = CallDetail(
+            client=self.client,
+            sequence_id=row.sequence_id,
+            user_name=row.user_name,
+            call_from=row.call_from,
+            call_to=row.call_to,
+            call_type=row.call_type,
+            dial_start_at=to_python_datetime(row.dial_start_at),
+            dial_answered_at=to_python_datetime(row.dial_answered_at),
+            dial_end_at=to_python_datetime(row.dial_end_at),
+            ringing_time=timedelta(seconds=int(row.ringing_seconds)),
+            call_duration=timedelta(seconds=int(row.duration_seconds)),
+            call_memo=row.call_memo,
+            call_charge="0",
+            carrier=self.carrier,
+            client_config=self.client_config,
+        )
+        patch = self._patches.get(key)
+        if patch:
+            call_detail.user_name = patch["user_name"]
+            call_detail.call_memo = patch["call_memo"]
+            for call_to in patch["call_to"]:
+                call_detail.call_to = set_if_empty(call_detail.call_to, call_to)
+        return call_detail
+
+    def __getitem__(self, key: str) -> CallDetail:
+        if key in self._extra:
+            return self._extra[key]
+        if key not in self._materialized:
+            if key not in self._positions:
+                raise KeyError(key)
+            self._materialized[key] = self._build(key)
+        return self._materialized[key]
+
+    def __setitem__(self, key: str, value: CallDetail) -> None:
+        if key in self._positions:
+            self._materialized[key] = value
+        else:
+            self._extra[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        raise TypeError("ColumnarCallDetails does not support deleting calls")
+
+    def __contains__(self, key) -> bool:
+        return key in self._positions or key in self._extra
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self._positions
+        yield from self._extra
+
+    def __len__(self) -> int:
+        return len(self._positions) + len(self._extra)
+
+
+def collapse_dashboard_frame(
+    frame: pd.DataFrame, client: str, carrier: str, call_details: Optional[dict[str, CallDetail]] = None
+) -> MutableMapping:
+    calls = ColumnarCallDetails(frame, client, carrier)
+    if not call_details:
+        return calls
+
+    # Merging into an existing store: keys already present are updated in place
+    # exactly like the row-by-row path (one pass over their rows, in file
+    # order); everything else stays lazy.
+    for row in frame[frame["final_key"].isin(list(call_details))].itertuples():
+        call_detail = call_details[row.final_key]
+        call_detail.user_name = row.user_name
+        call_detail.call_memo = row.call_memo
+        call_detail.call_to = set_if_empty(call_detail.call_to, parse_phone_number(row.call_to))
+    merged = dict(call_details)
+    for key in calls:
+        if key not in merged:
+            merged[key] = calls[key]
+    return merged
@@ -2,19 +2,49 @@ from typing import Optional
 
 import pandas as pd
 
+from config import CLIENTS
 from src.CallDetail import CallDetail
-from src.utils import parse_jakarta_datetime, convert_to_jakarta_time_iso, parse_phone_number, call_hash, set_if_empty, parse_iso_datetime
-import math
+from src.CallStore import FILL_EMPTY, OVERWRITE, OVERWRITE_IF_PRESENT, CallStore, JoinCounts
+from src.columnar import (
+    call_records,
+    collapse_dashboard_frame,
+    format_duration_column,
+    format_timestamp_column,
+    local_datetimes,
+    local_epoch_column,
+    read_console_frame,
+    read_dashboard_frame,
+    read_merged_frame,
+)
+from src.tariff import rate_batch_values
+from src.schema import CONSOLE_SCHEMA, DASHBOARD_SCHEMA, MERGED_SCHEMA, read_export, read_export_chunks
+from src.utils import convert_to_jakarta_time_iso, parse_phone_number, call_hash, set_if_empty, parse_iso_datetime, classify_number, client_timezone, format_charge, format_username, localize, print_unkeyed_rows, unkeyed_call_key
+import csv
+from datetime import timedelta
 
 
 def process_dashboard_csv(
-    file_path: str, carrier: str, call_details: Optional[dict[str, CallDetail]] = None, client: str = ""
+    file_path: str,
+    carrier: str,
+    call_details: Optional[dict[str, CallDetail]] = None,
+    client: str = "",
+    columnar: bool = False,
 ) -> dict[str, CallDetail]:
+    print(f"- Reading dashboard file {file_path}...")
+    df1 = read_export(file_path, DASHBOARD_SCHEMA)
+
+    if columnar:
+        # Parse whole columns at once; CallDetail objects are built on demand.
+        return collapse_dashboard_frame(
+            read_dashboard_frame(df1, client_timezone(CLIENTS.get(client))), client, carrier, call_details
+        )
+
     if call_details is None:
         call_details = {}
 
-    print(f"- Reading dashboard file {file_path}...")
-    df1 = pd.read_csv(file_path, low_memory=False).astype(str)
+    client_config = CLIENTS.get(client)
+    local_timezone = client_timezone(client_config)
+    unkeyed = 0
     for index, row in df1.iterrows():
         call_detail = CallDetail(
             client=client,
@@ -23,16 +53,19 @@ def process_dashboard_csv(
             call_from=parse_phone_number(row["Call from"]),
             call_to=parse_phone_number(row["Call to"]),
             call_type=row["Call type"],
-            dial_start_at=row["Dial begin time"],
-            dial_answered_at=row["Call begin time"],
-            dial_end_at=row["Call end time"],
-            ringing_time=row["Ringing time"],
-            call_duration=row["Call duration"],
+            dial_start_at=localize(parse_iso_datetime(row["Dial begin time"]), local_timezone),
+            dial_answered_at=localize(parse_iso_datetime(row["Call begin time"]), local_timezone),
+            dial_end_at=localize(parse_iso_datetime(row["Call end time"]), local_timezone),
+            ringing_time=timedelta(seconds=int(row["Ringing time"])),
+            call_duration=timedelta(seconds=int(row["Call duration"])),
             call_memo=row["Call memo"],
             call_charge="0",
             carrier=carrier,
+            client_config=client_config,
         )
         key = call_detail.final_key  # ✅ use final_key
+        if key is None:
+            key, unkeyed = unkeyed_call_key("dashboard", index), unkeyed + 1
         if key in call_details:
             existing_call_detail = call_details[key]
             existing_call_detail.user_name = row["User name"]
@@ -41,19 +74,47 @@ def process_dashboard_csv(
             existing_call_detail.call_to = set_if_empty(existing_call_detail.call_to, call_detail.call_to)
         else:
             call_details[key] = call_detail
+    print_unkeyed_rows(unkeyed, "dashboard")
     return call_details
 
+CONSOLE_CALL_TYPE_MAPPING = {
+    "OUTGOING_CALL": "Outbound call",
+    "OUTGOING_CALL_ABSENCE": "Outbound call (Missed)",
+}
+
+
 def process_console_csv(
-    file_path: str, carrier: str, call_details: dict[str, CallDetail], client: str = ""
+    file_path: str,
+    carrier: str,
+    call_details: dict[str, CallDetail],
+    client: str = "",
+    chunk_rows: Optional[int] = None,
 ) -> dict[str, CallDetail]:
-    df2 = pd.read_csv(file_path, low_memory=False).astype(str)
+    if chunk_rows:
+        # Stream the export: only one chunk of raw rows is held next to the merged store.
+        print(f"- Streaming console file {file_path} in chunks of {chunk_rows} rows...")
+        for chunk in read_export_chunks(file_path, CONSOLE_SCHEMA, chunk_rows):
+            merge_console_rows(chunk, carrier, call_details, client)
+            del chunk
+        return call_details
+
+    df2 = read_export(file_path, CONSOLE_SCHEMA)
+    return merge_console_rows(df2, carrier, call_details, client)
+
 
-    call_type_mapping = {
-        "OUTGOING_CALL": "Outbound call",
-        "OUTGOING_CALL_ABSENCE": "Outbound call (Missed)",
-    }
+def merge_console_rows(
+    df2: pd.DataFrame, carrier: str, call_details: dict[str, CallDetail], client: str = ""
+) -> dict[str, CallDetail]:
+    call_type_mapping = CONSOLE_CALL_TYPE_MAPPING
+    client_config = CLIENTS.get(client)
+    # Times are converted a whole column at a time rather than parsed per row.
+    starts, answers, ends = (
+        local_datetimes(*local_epoch_column(df2[column], df2["pbx_region"]))
+        for column in ("dial_starts_at", "dial_answered_at", "dial_ends_at")
+    )
 
-    for index, row in df2.iterrows():
+    unkeyed = 0
+    for (index, row), dial_start_at, dial_answered_at, dial_end_at in zip(df2.iterrows(), starts, answers, ends):
         normalized_call_from = parse_phone_number(row["used_number"])
         normalized_call_to = parse_phone_number(row["number"])
 
@@ -65,17 +126,20 @@ def process_console_csv(
             call_from=normalized_call_from,
             call_to=normalized_call_to,
             call_type=call_type_mapping.get(row["call_type"], row["call_type"]),
-            dial_start_at=parse_jakarta_datetime(row["dial_starts_at"], row["pbx_region"]),
-            dial_answered_at=parse_jakarta_datetime(row["dial_answered_at"], row["pbx_region"]),
-            dial_end_at=parse_jakarta_datetime(row["dial_ends_at"], row["pbx_region"]),
-            ringing_time=row["all_duration_of_call_sec_str"],
-            call_duration=row["duration_of_call_sec_str"],
+            dial_start_at=dial_start_at,
+            dial_answered_at=dial_answered_at,
+            dial_end_at=dial_end_at,
+            ringing_time=timedelta(seconds=int(row["all_duration_of_call_sec_str"])),
+            call_duration=timedelta(seconds=int(row["duration_of_call_sec_str"])),
             call_memo="",
             call_charge=row["discount"],
             carrier=carrier,
             number_type=row["number_type"],
+            client_config=client_config,
         )
         key = temp_call.final_key  # ✅ CORRECT variable
+        if key is None:
+            key, unkeyed = unkeyed_call_key("console", index), unkeyed + 1
 
         if key in call_details:
             call_detail = call_details[key]
@@ -88,20 +152,23 @@ def process_console_csv(
             call_detail.dial_end_at = temp_call.dial_end_at
             call_detail.ringing_time = temp_call.ringing_time
             call_detail.call_duration = temp_call.call_duration
-            call_detail.call_charge = temp_call.call_charge
             call_detail.number_type = temp_call.number_type
+            # The charge is computed from the merged fields in finalize_calls.
         else:
             call_details[key] = temp_call
 
+    print_unkeyed_rows(unkeyed, "console")
     return call_details
 
 def process_merged_csv(
     file_path: str, call_details: dict[str, CallDetail], carrier: str
 ) -> dict[str, CallDetail]:
     print(f"- Reading {file_path} file...")
-    df3 = pd.read_csv(file_path, low_memory=False).astype(str)
+    df3 = read_export(file_path, MERGED_SCHEMA)
     print("- Processing merged CSV file...")
 
+    local_timezone = client_timezone(None)
+    unkeyed = 0
     for index, row in df3.iterrows():
         merged_call = CallDetail(
             sequence_id=row.get("call_id") or row.get("Sequence ID"),
@@ -109,11 +176,11 @@ def process_merged_csv(
             call_from=parse_phone_number(row["Call from"]),
             call_to=parse_phone_number(row["Call to"]),
             call_type=row["Call type"],
-            dial_start_at=parse_iso_datetime(row["Dial starts at"]),
-            dial_answered_at=parse_iso_datetime(row["Dial answered at"]),
-            dial_end_at=parse_iso_datetime(row["Dial ends at"]),
-            ringing_time=row["Ringing time"],
-            call_duration=row["Call duration"],
+            dial_start_at=localize(parse_iso_datetime(row["Dial starts at"]), local_timezone),
+            dial_answered_at=localize(parse_iso_datetime(row["Dial answered at"]), local_timezone),
+            dial_end_at=localize(parse_iso_datetime(row["Dial ends at"]), local_timezone),
+            ringing_time=timedelta(seconds=int(row["Ringing time"])),
+            call_duration=timedelta(seconds=int(row["Call duration"])),
             call_memo=row["Call memo"],
             call_charge=row["Call charge"],
             carrier=carrier,
@@ -121,6 +188,8 @@ def process_merged_csv(
             client=""
         )
         key = merged_call.final_key
+        if key is None:
+            key, unkeyed = unkeyed_call_key("merged", index), unkeyed + 1
 
         if key in call_details:
             call_detail = call_details[key]
@@ -139,38 +208,245 @@ def process_merged_csv(
             call_detail.call_duration = merged_call.call_duration
             if merged_call.call_memo.strip():
                 call_detail.call_memo = merged_call.call_memo
-            call_detail.call_charge = merged_call.call_charge
 
         else:
             call_details[key] = merged_call
 
+    print_unkeyed_rows(unkeyed, "merged")
     return call_details
 
-def round_up_duration(call_duration: str) -> int:
-    try:
-        #print(f"Processing call duration: {call_duration}")
-        
-        if ':' in call_duration:
-            h, m, s = map(int, call_duration.split(':'))
-            total_minutes = h * 60 + m + math.ceil(s / 60)
-        else:
-            total_minutes = math.ceil(int(call_duration) / 60)  # Assume it's in seconds
-        
-        return total_minutes
-    except Exception as e:
-        print(f"Error parsing call duration: {call_duration}, Error: {e}")
-        return 0
+def finalize_calls(call_details: dict[str, CallDetail]) -> dict[str, CallDetail]:
+    """Classify and rate every merged call once, after all sources are in.
+
+    Calls are rated per client in one batch (see rate_batch_values), which
+    gives the same charges as CallDetail.finalize() one call at a time.
+    """
+    print("- Rating merged calls...")
+    by_client: dict[int, list[CallDetail]] = {}
+    for call_detail in call_details.values():
+        call_detail.iso = call_detail.classify()
+        by_client.setdefault(id(call_detail.matched_client), []).append(call_detail)
+
+    for calls in by_client.values():
+        charges = rate_batch_values(
+            calls[0].matched_client,
+            [call.duration_seconds for call in calls],
+            [call.call_type for call in calls],
+            [call.iso for call in calls],
+            [call.call_from for call in calls],
+            [call.call_to for call in calls],
+        )
+        for call, charge in zip(calls, charges):
+            call.call_charge = charge
+    return call_details
+
+def round_up_minutes(duration_seconds):
+    """Whole minutes of a call, rounded up, from stored seconds (an int or an int array).
+
+    Whole days are dropped first, as they are from the written "H:MM:SS"
+    duration (see format_timedelta).
+    """
+    return -(-(duration_seconds % 86400) // 60)
+
+
+MERGED_CSV_COLUMNS = [
+    "Sequence ID",
+    "User name",
+    "Call from",
+    "Call to",
+    "Call type",
+    "Number type",
+    "ISO",
+    "Dial starts at",
+    "Dial answered at",
+    "Dial ends at",
+    "Ringing time",
+    "Call duration",
+    "Call memo",
+    "Call charge",
+    "Round up duration",
+]
+# Rows formatted and handed to the CSV writer at a time.
+WRITE_BATCH_ROWS = 10_000
+
+
+def save_merged_csv(
+    call_details: dict[str, CallDetail], output_path: str, batch_rows: int = WRITE_BATCH_ROWS
+) -> None:
+    """Write the merged calls in batches, without building the whole table in memory first."""
+    print("- Saving merged CSV file...")
+    with open(output_path, "w", newline="") as csv_file:
+        writer = csv.writer(csv_file, lineterminator="\n")
+        writer.writerow(MERGED_CSV_COLUMNS)
+        batch = []
+        for value in call_details.values():
+            call_dict = value.to_dict()
+            call_dict["Round up duration"] = round_up_minutes(value.duration_seconds)
+            batch.append([call_dict[column] for column in MERGED_CSV_COLUMNS])
+            if len(batch) >= batch_rows:
+                writer.writerows(batch)
+                batch.clear()
+        writer.writerows(batch)
+    print(f"- Merged CSV saved to {output_path}")
+
+# Precedence when a dashboard row repeats a call: the name and the raw memo are
+# overwritten, call_to only fills a gap.
+DASHBOARD_RULES = {"user_name": OVERWRITE, "call_memo": OVERWRITE, "call_to": FILL_EMPTY}
+
+# Precedence when a console row matches a stored call: the console owns the
+# call's progress and durations; call_to is taken unless the console left it empty.
+CONSOLE_RULES = {
+    "call_to": OVERWRITE_IF_PRESENT,
+    "call_type": OVERWRITE,
+    "dial_answered_at": OVERWRITE,
+    "dial_end_at": OVERWRITE,
+    "ringing_seconds": OVERWRITE,
+    "duration_seconds": OVERWRITE,
+    "number_type": OVERWRITE,
+}
+
+# Precedence when a previously merged export is folded back in: it wins on
+# everything it carries, except call_to (fallback only) and an empty memo.
+MERGED_RULES = {
+    "call_to": FILL_EMPTY,
+    "user_name": OVERWRITE,
+    "call_from": OVERWRITE,
+    "call_type": OVERWRITE,
+    "dial_start_at": OVERWRITE,
+    "dial_answered_at": OVERWRITE,
+    "dial_end_at": OVERWRITE,
+    "ringing_seconds": OVERWRITE,
+    "duration_seconds": OVERWRITE,
+    "call_memo": OVERWRITE_IF_PRESENT,
+}
+
+
+def load_dashboard_store(
+    file_path: str, carrier: str, client: str = "", store: Optional[CallStore] = None
+) -> CallStore:
+    """process_dashboard_csv into a CallStore."""
+    print(f"- Reading dashboard file {file_path}...")
+    if store is None:
+        store = CallStore(client, carrier)
+    return upsert_dashboard_rows(store, read_export(file_path, DASHBOARD_SCHEMA))
+
+
+def upsert_dashboard_rows(store: CallStore, df: pd.DataFrame) -> CallStore:
+    """Apply dashboard rows (read with DASHBOARD_SCHEMA) to a store, in order."""
+    frame = read_dashboard_frame(df, client_timezone(store.client_config))
+    records = call_records(frame)
+    # Repeated rows write the memo as-is, only the first one is cleaned up.
+    updates = {**records, "call_memo": frame["call_memo"].to_numpy(dtype=object)}
+    store.upsert(frame["final_key"], records, DASHBOARD_RULES, updates)
+    return store
+
+
+def merge_console_store(file_path: str, store: CallStore, chunk_rows: Optional[int] = None) -> CallStore:
+    """process_console_csv into a CallStore."""
+    if chunk_rows:
+        print(f"- Streaming console file {file_path} in chunks of {chunk_rows} rows...")
+        frames = read_export_chunks(file_path, CONSOLE_SCHEMA, chunk_rows)
+    else:
+        frames = [read_export(file_path, CONSOLE_SCHEMA)]
+
+    for df2 in frames:
+        upsert_console_rows(store, df2)
+    return store
+
+
+def upsert_console_rows(store: CallStore, df: pd.DataFrame) -> CallStore:
+    """Apply console rows (read with CONSOLE_SCHEMA) to a store, in order."""
+    frame = read_console_frame(df, CONSOLE_CALL_TYPE_MAPPING)
+    store.upsert(frame["final_key"], call_records(frame), CONSOLE_RULES)
+    return store
+
+
+def print_join_counts(counts: JoinCounts, stored: str, incoming: str) -> None:
+    print(
+        f"- Joined {incoming}: {counts.matched} matched, "
+        f"{counts.only_stored} {stored} only, {counts.only_incoming} {incoming} only"
+    )
+    if counts.rescued:
+        print(f"- {counts.rescued} calls without a sequence ID matched within the time tolerance")
+
+
+def join_console_store(file_path: str, store: CallStore, tolerance_seconds: Optional[int] = None) -> JoinCounts:
+    """merge_console_store as one outer join on final_key; returns the matched/unmatched counts.
+
+    With tolerance_seconds, calls without a sequence ID also match when their
+    start times differ by at most that many seconds (see CallStore.join).
+    """
+    frame = read_console_frame(read_export(file_path, CONSOLE_SCHEMA), CONSOLE_CALL_TYPE_MAPPING)
+    counts = store.join(frame["final_key"], call_records(frame), CONSOLE_RULES, tolerance_seconds=tolerance_seconds)
+    print_join_counts(counts, "dashboard", "console")
+    return counts
+
+
+def join_merged_store(file_path: str, store: CallStore) -> JoinCounts:
+    """process_merged_csv as one outer join on final_key; returns the matched/unmatched counts."""
+    print(f"- Reading {file_path} file...")
+    frame = read_merged_frame(read_export(file_path, MERGED_SCHEMA), client_timezone(store.client_config))
+    counts = store.join(frame["final_key"], call_records(frame), MERGED_RULES)
+    print_join_counts(counts, "stored", "merged")
+    return counts
+
+
+def finalize_store(store: CallStore) -> CallStore:
+    """finalize_calls for a CallStore: classify every call, then rate the whole store in one batch."""
+    print("- Rating merged calls...")
+    return rate_store(store)
+
+
+def rate_store(store: CallStore) -> CallStore:
+    call_from, call_to = store.column("call_from"), store.column("call_to")
+    call_type, number_type = store.column("call_type"), store.column("number_type")
+    store.column("iso")[:] = [
+        classify_number(to, kind, source, to, console_type)
+        for source, to, kind, console_type in zip(call_from, call_to, call_type, number_type)
+    ]
+    store.column("call_charge")[:] = rate_batch_values(
+        store.client_config, store.column("duration_seconds"), call_type, store.column("iso"), call_from, call_to
+    )
+    return store
 
 
-def save_merged_csv(call_details: dict[str, CallDetail], output_path: str) -> None:
+def save_store_csv(store: CallStore, output_path: str) -> None:
+    """save_merged_csv for a CallStore; values are formatted a column at a time."""
     print("- Saving merged CSV file...")
-    call_details_list = []
+    with open(output_path, "w", newline="") as csv_file:
+        for start in range(0, max(len(store), 1), WRITE_BATCH_ROWS):
+            batch = store_output_frame(store, start, start + WRITE_BATCH_ROWS)
+            batch.to_csv(csv_file, index=False, header=start == 0, lineterminator="\n")
+    print(f"- Merged CSV saved to {output_path}")
 
-    for value in call_details.values():
-        call_dict = value.to_dict()
-        call_dict["Round up duration"] = round_up_duration(call_dict["Call duration"])
-        call_details_list.append(call_dict)
 
-    df = pd.DataFrame(call_details_list)
-    df.to_csv(output_path, index=False)
-    print(f"- Merged CSV saved to {output_path}")
\ No newline at end of file
+def store_output_frame(store: CallStore, start: int = 0, stop: Optional[int] = None) -> pd.DataFrame:
+    """The rows save_merged_csv writes, for every call in the store (or rows start:stop)."""
+    frame = store.to_frame(start, stop)
+    duration = frame["duration_seconds"].to_numpy()
+    return pd.DataFrame(
+        {
+            "Sequence ID": frame["sequence_id"],
+            "User name": frame["user_name"].map(format_username),
+            "Call from": frame["call_from"],
+            "Call to": frame["call_to"],
+            "Call type": frame["call_type"],
+            "Number type": frame["number_type"],
+            "ISO": frame["iso"],
+            "Dial starts at": format_timestamp_column(
+                frame["dial_start_at"].to_numpy(), frame["dial_start_at_offset"].to_numpy()
+            ),
+            "Dial answered at": format_timestamp_column(
+                frame["dial_answered_at"].to_numpy(), frame["dial_answered_at_offset"].to_numpy()
+            ),
+            "Dial ends at": format_timestamp_column(
+                frame["dial_end_at"].to_numpy(), frame["dial_end_at_offset"].to_numpy()
+            ),
+            "Ringing time": format_duration_column(frame["ringing_seconds"].to_numpy()),
+            "Call duration": format_duration_column(duration),
+            "Call memo": frame["call_memo"],
+            "Call charge": frame["call_charge"].map(format_charge),
+            "Round up duration": round_up_minutes(duration),
+        },
+        columns=MERGED_CSV_COLUMNS,
+    )
@@ -0,0 +1,228 @@
+import heapq
+import os
+import pickle
+import tempfile
+from itertools import islice
+from operator import itemgetter
+from typing import Callable, Iterable, Iterator, Optional
+
+import numpy as np
+import pandas as pd
+
+from src.CallStore import FIELDS, CallStore
+from src.FileConfig import Files
+from src.columnar import call_records, read_console_frame, read_dashboard_frame
+from src.csv_processing import (
+    CONSOLE_CALL_TYPE_MAPPING,
+    CONSOLE_RULES,
+    DASHBOARD_RULES,
+    MERGED_CSV_COLUMNS,
+    rate_store,
+    store_output_frame,
+)
+from src.schema import CONSOLE_SCHEMA, DASHBOARD_SCHEMA, ReadSchema, read_export_chunks
+from src.utils import client_timezone
+
+# Rough peak cost of one export row while a chunk is parsed and sorted (raw
+# strings, typed frame, records and the sorted copy). Sizes every stage below.
+BYTES_PER_PARSED_ROW = 4096
+# Rows per pickled block in a run file; a merge keeps one block per run in memory.
+RUN_BLOCK_ROWS = 128
+# Rough size of one row of a run once unpickled (a tuple of ~20 small objects).
+BYTES_PER_RUN_ROW = 1536
+
+DASHBOARD, CONSOLE = 0, 1
+# Store fields carried through the run files; iso and call_charge are computed after the merge.
+RUN_FIELDS = [name for name in FIELDS if name not in ("iso", "call_charge")]
+# final_key and row lead every run row: runs are sorted on them and merged on them.
+RUN_COLUMNS = ["final_key", "row", "source", *RUN_FIELDS, "update_memo"]
+
+
+def rows_for_budget(budget_mb: float) -> int:
+    """Rows per sorted run so that parsing one chunk stays within budget_mb."""
+    return max(1000, int(budget_mb * 1024 * 1024) // BYTES_PER_PARSED_ROW)
+
+
+def max_fan_in(budget_mb: float) -> int:
+    """How many runs one merge may read at once: their blocks take at most an eighth of the budget."""
+    fan_in = int(budget_mb * 1024 * 1024) // 8 // (RUN_BLOCK_ROWS * BYTES_PER_RUN_ROW)
+    return min(max(fan_in, 16), 512)
+
+
+def write_rows(rows: Iterable[tuple], directory: str) -> str:
+    """Write already sorted rows as a run file of pickled blocks."""
+    handle, path = tempfile.mkstemp(suffix=".run", dir=directory)
+    with os.fdopen(handle, "wb") as run:
+        for block in iter(lambda: list(islice(rows, RUN_BLOCK_ROWS)), []):
+            pickle.dump(block, run, protocol=pickle.HIGHEST_PROTOCOL)
+    return path
+
+
+def write_run(frame: pd.DataFrame, directory: str) -> str:
+    """Write an already sorted frame as a run file."""
+    return write_rows(frame.itertuples(index=False, name=None), directory)
+
+
+def read_run(path: str) -> Iterator[tuple]:
+    """Rows of a run file, one block in memory at a time. The file is removed once read."""
+    with open(path, "rb") as run:
+        while True:
+            try:
+                block = pickle.load(run)
+            except EOFError:
+                break
+            yield from block
+    os.remove(path)
+
+
+def sorted_runs(
+    file_path: str,
+    schema: ReadSchema,
+    read_frame: Callable[[pd.DataFrame], pd.DataFrame],
+    source: int,
+    first_row: int,
+    run_rows: int,
+    directory: str,
+) -> tuple[list[str], int]:
+    """Split an export into run files sorted by (final_key, row); returns the paths and the next row number.
+
+    Rows are numbered across both exports (dashboard first), which is the
+    order the in-memory processors apply them in.
+    """
+    paths = []
+    for chunk in read_export_chunks(file_path, schema, run_rows):
+        frame = read_frame(chunk)
+        records = call_records(frame)
+        size = len(frame)
+        run = pd.DataFrame(
+            {
+                "final_key": frame["final_key"].to_numpy(dtype=object),
+                "row": np.arange(first_row, first_row + size),
+                "source": source,
+                **{
+                    name: records[name] if name in records else np.full(size, FIELDS[name][1], dtype=FIELDS[name][0])
+                    for name in RUN_FIELDS
+                },
+                # Repeated dashboard rows write the raw memo (see load_dashboard_store).
+                "update_memo": frame["call_memo"].to_numpy(dtype=object) if source == DASHBOARD else records["call_memo"],
+            },
+            columns=RUN_COLUMNS,
+        )
+        paths.append(write_run(run.sort_values(["final_key", "row"], kind="stable"), directory))
+        first_row += size
+        del chunk, frame, records, run
+    return paths, first_row
+
+
+def merge_runs(paths: list[str], key: Callable, fan_in: int, directory: str) -> Iterator[tuple]:
+    """Every row of every run in key order.
+
+    With more than fan_in runs, groups of them are first merged into longer
+    runs, so the final merge never holds more than fan_in blocks.
+    """
+    paths = list(paths)
+    while len(paths) > fan_in:
+        group, paths = paths[:fan_in], paths[fan_in:]
+        paths.append(write_rows(heapq.merge(*(read_run(path) for path in group), key=key), directory))
+    return heapq.merge(*(read_run(path) for path in paths), key=key)
+
+
+def merged_groups(rows_in_key_order: Iterable[tuple], block_rows: int) -> Iterator[pd.DataFrame]:
+    """Blocks of (final_key, row)-ordered run rows that never split a key."""
+    rows: list[tuple] = []
+    for row in rows_in_key_order:
+        if len(rows) >= block_rows and row[0] != rows[-1][0]:
+            yield pd.DataFrame.from_records(rows, columns=RUN_COLUMNS)
+            rows = []
+        rows.append(row)
+    if rows:
+        yield pd.DataFrame.from_records(rows, columns=RUN_COLUMNS)
+
+
+def merge_group_block(block: pd.DataFrame, client: str, carrier: str) -> pd.DataFrame:
+    """Merge, classify and rate one block of whole key groups; returns output rows plus their position.
+
+    Within a key the block holds dashboard rows before console rows, each in
+    file order, so two upserts replay exactly what the in-memory processors do.
+    """
+    store = CallStore(client, carrier, capacity=len(block))
+    dashboard = block[block["source"] == DASHBOARD]
+    console = block[block["source"] == CONSOLE]
+    records = {name: dashboard[name].to_numpy() for name in RUN_FIELDS}
+    updates = {**records, "call_memo": dashboard["update_memo"].to_numpy()}
+    store.upsert(dashboard["final_key"], records, DASHBOARD_RULES, updates)
+    store.upsert(console["final_key"], {name: console[name].to_numpy() for name in RUN_FIELDS}, CONSOLE_RULES)
+    rate_store(store)
+
+    # A call is written where the in-memory path would have inserted it: at its first row.
+    first_rows = block.drop_duplicates("final_key").set_index("final_key")["row"]
+    output = store_output_frame(store)
+    output.insert(0, "position", first_rows.reindex(store.keys()).to_numpy())
+    return output
+
+
+def merge_files_out_of_core(
+    files: Files, budget_mb: float, output_path: Optional[str] = None, temp_dir: Optional[str] = None
+) -> int:
+    """Merge one client's exports with an external sort-merge; returns the number of calls written.
+
+    Both exports are cut into sorted run files, the runs are merged in one
+    streaming pass, and the finished rows go through a second external sort
+    so the CSV comes out in the same order as save_merged_csv writes it.
+    Memory stays within roughly budget_mb whatever the size of the exports.
+    """
+    output_path = output_path or files.output
+    run_rows = rows_for_budget(budget_mb)
+    # Merged blocks hold fully built rows from every run at once; keep them smaller than a parsed chunk.
+    block_rows = max(1000, run_rows // 4)
+    fan_in = max_fan_in(budget_mb)
+    with tempfile.TemporaryDirectory(prefix="auto-anna-", dir=temp_dir) as directory:
+        print(f"- Sorting dashboard file {files.dashboard} in runs of {run_rows} rows...")
+        paths, next_row = sorted_runs(
+            files.dashboard,
+            DASHBOARD_SCHEMA,
+            lambda chunk: read_dashboard_frame(chunk, client_timezone(files)),
+            DASHBOARD,
+            0,
+            run_rows,
+            directory,
+        )
+        print(f"- Sorting console file {files.console} in runs of {run_rows} rows...")
+        console_paths, _ = sorted_runs(
+            files.console,
+            CONSOLE_SCHEMA,
+            lambda chunk: read_console_frame(chunk, CONSOLE_CALL_TYPE_MAPPING),
+            CONSOLE,
+            next_row,
+            run_rows,
+            directory,
+        )
+        paths += console_paths
+
+        print(f"- Merging and rating {len(paths)} runs...")
+        output_paths = []
+        for block in merged_groups(merge_runs(paths, itemgetter(0, 1), fan_in, directory), block_rows):
+            output = merge_group_block(block, files.client, files.carrier)
+            output_paths.append(write_run(output.sort_values("position", kind="stable"), directory))
+            del block, output
+
+        print("- Saving merged CSV file...")
+        columns = ["position", *MERGED_CSV_COLUMNS]
+        calls = 0
+        rows: list[tuple] = []
+        with open(output_path, "w", newline="") as csv_file:
+            for row in merge_runs(output_paths, itemgetter(0), fan_in, directory):
+                rows.append(row)
+                if len(rows) >= block_rows:
+                    _append_rows(csv_file, rows, columns, header=calls == 0)
+                    calls, rows = calls + len(rows), []
+            if rows or calls == 0:
+                _append_rows(csv_file, rows, columns, header=calls == 0)
+                calls += len(rows)
+    print(f"- Merged CSV saved to {output_path}")
+    return calls
+
+
+def _append_rows(csv_file, rows: list[tuple], columns: list[str], header: bool) -> None:
+    frame = pd.DataFrame.from_records(rows, columns=columns).drop(columns="position")
+    frame.to_csv(csv_file, index=False, header=header, lineterminator="\n")
@@ -0,0 +1,181 @@
+import os
+from datetime import datetime, timezone
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from src.CallStore import FIELDS, NULL_TIME, CallStore
+from src.FileConfig import Files
+from src.columnar import epoch_seconds_column, local_epoch_column, localize_column, parse_iso_datetime_column
+from src.csv_processing import CONSOLE_RULES, upsert_console_rows, upsert_dashboard_rows
+from src.parse_cache import PARSER_VERSION, pack_store, read_pickle, unpack_store, write_pickle
+from src.schema import CONSOLE_SCHEMA, DASHBOARD_SCHEMA, ReadSchema, apply_schema, read_raw_chunks
+from src.utils import PBX_REGION_UTC_OFFSETS, client_timezone
+
+DEFAULT_OVERLAP_HOURS = 24
+STATE_VERSION = 1
+# Export rows read at a time. Of a chunk that lies wholly before the cutoff only the start times are parsed.
+READ_CHUNK_ROWS = 100_000
+
+
+def state_path(state_dir: str, client: str) -> str:
+    return os.path.join(state_dir, client.replace(os.sep, "_") + ".state")
+
+
+def wall_seconds(seconds: np.ndarray, offsets: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """(wall-clock epoch seconds, missing mask) of start times as CallStore keeps them (UTC seconds, offsets)."""
+    missing = seconds == NULL_TIME
+    return np.where(missing, 0, seconds + offsets), missing
+
+
+def dashboard_starts(df: pd.DataFrame, files: Files) -> tuple[np.ndarray, np.ndarray]:
+    """wall_seconds of raw dashboard rows, parsed the way read_dashboard_frame parses them."""
+    parsed = localize_column(parse_iso_datetime_column(df["Dial begin time"]), client_timezone(files))
+    return wall_seconds(*epoch_seconds_column(parsed))
+
+
+def console_starts(df: pd.DataFrame, files: Files) -> tuple[np.ndarray, np.ndarray]:
+    """wall_seconds of raw console rows, parsed the way read_console_frame parses them."""
+    return wall_seconds(*local_epoch_column(df["dial_starts_at"], df["pbx_region"]))
+
+
+def _read_unfrozen(
+    files: Files, path: str, schema: ReadSchema, starts, cutoff: Optional[int]
+) -> tuple[pd.DataFrame, np.ndarray, np.ndarray, int]:
+    """(rows not frozen by an earlier run, their wall-clock starts, missing mask, rows in the export).
+
+    The export is read as text in chunks. Only the start times are parsed to
+    drop the frozen rows; the schema is applied to the rest.
+    """
+    frames, seconds, missing, total = [], [], [], 0
+    for chunk in read_raw_chunks(path, schema, READ_CHUNK_ROWS):
+        total += len(chunk)
+        chunk_seconds, chunk_missing = starts(chunk, files)
+        unread = chunk_missing | (chunk_seconds >= cutoff if cutoff is not None else True)
+        if frames and not unread.any():
+            continue
+        frames.append(chunk[unread])
+        seconds.append(chunk_seconds[unread])
+        missing.append(chunk_missing[unread])
+    if not frames:
+        # No data rows at all.
+        frames = [pd.read_csv(path, usecols=lambda column: column in schema.columns, dtype=str, nrows=0)]
+        seconds, missing = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=bool)]
+    df = apply_schema(pd.concat(frames), schema)
+    return df, np.concatenate(seconds), np.concatenate(missing), total
+
+
+def _format_wall(seconds: Optional[int]) -> str:
+    if seconds is None:
+        return "the start"
+    return datetime.fromtimestamp(seconds, timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _region(files: Files) -> tuple:
+    """The client's pbx_region and the region offsets: frozen rows were localized with them."""
+    return files.pbx_region, sorted(PBX_REGION_UTC_OFFSETS.items())
+
+
+def _load_state(path: str, files: Files) -> Optional[dict]:
+    state = read_pickle(path)
+    if state is None:
+        return None
+    same_inputs = state.get("inputs") == (files.dashboard, files.console) and state.get("carrier") == files.carrier
+    same_region = state.get("region") == _region(files)
+    if state.get("version") != (STATE_VERSION, PARSER_VERSION) or not same_inputs or not same_region:
+        print(f"- Incremental state {path} is for other exports, another region or an older parser, starting over")
+        return None
+    return state
+
+
+def _split_rows(
+    df: pd.DataFrame, starts: np.ndarray, missing: np.ndarray, new_cutoff: Optional[int]
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """(rows to freeze now, rows to keep live) among those not frozen by an earlier run.
+
+    Rows without a start time are never frozen, so every run re-reads them.
+    """
+    freeze = ~missing & (starts < new_cutoff if new_cutoff is not None else False)
+    return df[freeze], df[~freeze]
+
+
+def _copy(store: CallStore) -> CallStore:
+    return unpack_store(pack_store(store), store.client, store.carrier)
+
+
+def merge_incremental(files: Files, state_dir: str, overlap_hours: float = DEFAULT_OVERLAP_HOURS) -> CallStore:
+    """Merge one client's exports, parsing only the rows that changed since the last run; returns an unrated store.
+
+    The state kept per client holds a watermark (the latest call start seen)
+    and, for each export separately, the merged rows that started before the
+    cutoff (the watermark of the previous run minus the overlap). Of those
+    rows only the start time is parsed again, to tell them apart from the
+    rest. Everything from the cutoff on is parsed on each run, so late
+    console updates inside the overlap window are picked up.
+
+    Dashboard and console rows are merged separately and combined at the end,
+    which gives the same calls as merging both exports in full: the console's
+    rules only look at the last console value of each field. Calls come out in
+    the order they were first frozen or seen, which matches a full run when
+    the exports are in chronological order.
+    """
+    path = state_path(state_dir, files.client)
+    state = _load_state(path, files)
+    cutoff = state["cutoff"] if state else None
+    watermark = state["watermark"] if state else None
+
+    print(f"- Reading exports for rows since {_format_wall(cutoff)}...")
+    dashboard_df, dashboard_seconds, dashboard_missing, dashboard_rows = _read_unfrozen(
+        files, files.dashboard, DASHBOARD_SCHEMA, dashboard_starts, cutoff
+    )
+    console_df, console_seconds, console_missing, console_rows = _read_unfrozen(
+        files, files.console, CONSOLE_SCHEMA, console_starts, cutoff
+    )
+
+    # Frozen rows start before the old watermark, so the unfrozen ones are enough to move it.
+    present = np.concatenate([dashboard_seconds[~dashboard_missing], console_seconds[~console_missing]])
+    if len(present):
+        watermark = int(present.max()) if watermark is None else max(int(present.max()), watermark)
+    new_cutoff = cutoff
+    if watermark is not None:
+        new_cutoff = watermark - int(overlap_hours * 3600)
+        if cutoff is not None:
+            # Frozen rows stay frozen, even if the exports now end earlier.
+            new_cutoff = max(new_cutoff, cutoff)
+
+    if state:
+        dashboard = unpack_store(state["dashboard"], files.client, files.carrier)
+        console = unpack_store(state["console"], files.client, files.carrier)
+    else:
+        dashboard, console = CallStore(files.client, files.carrier), CallStore(files.client, files.carrier)
+
+    dashboard_freeze, dashboard_live = _split_rows(dashboard_df, dashboard_seconds, dashboard_missing, new_cutoff)
+    console_freeze, console_live = _split_rows(console_df, console_seconds, console_missing, new_cutoff)
+    print(
+        f"- Parsing {len(dashboard_df)} of {dashboard_rows} dashboard rows "
+        f"and {len(console_df)} of {console_rows} console rows"
+    )
+    del dashboard_df, console_df
+    upsert_dashboard_rows(dashboard, dashboard_freeze)
+    upsert_console_rows(console, console_freeze)
+    write_pickle(
+        path,
+        {
+            "version": (STATE_VERSION, PARSER_VERSION),
+            "inputs": (files.dashboard, files.console),
+            "carrier": files.carrier,
+            "region": _region(files),
+            "cutoff": new_cutoff,
+            "watermark": watermark,
+            "dashboard": pack_store(dashboard),
+            "console": pack_store(console),
+        },
+    )
+    print(f"- Incremental state saved, rows before {_format_wall(new_cutoff)} are final")
+
+    # The live rows are merged on copies: the next run reads them again.
+    merged = upsert_dashboard_rows(_copy(dashboard), dashboard_live)
+    console = upsert_console_rows(console, console_live)
+    merged.upsert(console.keys(), {name: console.column(name) for name in FIELDS}, CONSOLE_RULES)
+    return merged
@@ -0,0 +1,123 @@
+import dataclasses
+import hashlib
+import json
+import os
+import tempfile
+from typing import Optional
+
+from src.FileConfig import Files
+from src.idn_area_codes import EMERGENCY_NUMBERS, INTERNATIONAL_PHONE_PREFIXES, PHONE_PREFIXES
+from src.international_rates import INTERNATIONAL_RATES
+from src.parquet_output import client_parts
+from src.parse_cache import PARSER_VERSION, file_digest
+from src.tariff import TARIFF_CONSTANTS
+from src.utils import PBX_REGION_UTC_OFFSETS, SPECIAL_PREFIXES
+
+DEFAULT_MANIFEST = ".auto-anna-manifest.json"
+MANIFEST_VERSION = 1
+# Run options that change what a client's outputs contain; the others only change how they are computed.
+OUTPUT_OPTIONS = ("match_tolerance", "parquet_root")
+
+
+def _digest(value) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()
+
+
+RATES_DIGEST = _digest(INTERNATIONAL_RATES)
+PREFIXES_DIGEST = _digest({
+    "emergency": EMERGENCY_NUMBERS,
+    "international": INTERNATIONAL_PHONE_PREFIXES,
+    "phone": PHONE_PREFIXES,
+    "special": SPECIAL_PREFIXES,
+})
+TARIFF_DIGEST = _digest(TARIFF_CONSTANTS)
+REGIONS_DIGEST = _digest(PBX_REGION_UTC_OFFSETS)
+
+
+def load_manifest(path: str) -> dict[str, dict]:
+    """Fingerprints of the last successful run, by client ({} if there is none yet)."""
+    try:
+        with open(path) as manifest_file:
+            manifest = json.load(manifest_file)
+    except FileNotFoundError:
+        return {}
+    except ValueError as error:
+        print(f"- Ignoring unreadable manifest {path}: {error}")
+        return {}
+    if manifest.get("version") != MANIFEST_VERSION:
+        return {}
+    return manifest.get("clients", {})
+
+
+def save_manifest(path: str, clients: dict[str, dict]) -> None:
+    directory = os.path.dirname(os.path.abspath(path))
+    handle, temp_path = tempfile.mkstemp(suffix=".tmp", dir=directory)
+    with os.fdopen(handle, "w") as manifest_file:
+        json.dump({"version": MANIFEST_VERSION, "clients": clients}, manifest_file, indent=2, sort_keys=True)
+    os.replace(temp_path, path)
+
+
+def file_fingerprint(path: str, previous: Optional[dict] = None) -> dict:
+    """Size, mtime and content hash of a file.
+
+    The hash of the previous fingerprint is reused while size and mtime are
+    unchanged, so an unchanged export is not read again.
+    """
+    stat = os.stat(path)
+    if previous and previous.get("size") == stat.st_size and previous.get("mtime_ns") == stat.st_mtime_ns:
+        sha256 = previous["sha256"]
+    else:
+        sha256 = file_digest(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256}
+
+
+def client_fingerprint(files: Files, options: dict, previous: Optional[dict] = None) -> dict:
+    previous_inputs = (previous or {}).get("inputs", {})
+    return {
+        "inputs": {path: file_fingerprint(path, previous_inputs.get(path)) for path in (files.dashboard, files.console)},
+        "files": _digest(dataclasses.asdict(files)),
+        "rates": RATES_DIGEST,
+        "prefixes": PREFIXES_DIGEST,
+        "tariff": TARIFF_DIGEST,
+        "regions": REGIONS_DIGEST,
+        "parser": PARSER_VERSION,
+        "options": _digest({name: options.get(name) for name in OUTPUT_OPTIONS}),
+    }
+
+
+def _content(fingerprint: dict) -> dict:
+    """A fingerprint without mtimes: touching an export without changing it does not count as a change."""
+    inputs = {path: (value["size"], value["sha256"]) for path, value in fingerprint["inputs"].items()}
+    return {**fingerprint, "inputs": inputs}
+
+
+def _outputs_exist(files: Files, options: dict) -> bool:
+    parquet_root = options.get("parquet_root")
+    return os.path.exists(files.output) and (not parquet_root or bool(client_parts(parquet_root, files.client)))
+
+
+def plan_clients(
+    config: list[Files], manifest: dict[str, dict], options: dict, force: bool = False
+) -> tuple[list[Files], list[Files], dict[str, dict]]:
+    """Split the config into (clients to merge, unchanged clients to skip) plus every client's fingerprint.
+
+    A client is skipped when its fingerprint matches the manifest and its
+    outputs still exist: the merged CSV and, with parquet_root, its Parquet
+    files. force merges every client.
+    """
+    to_merge, skipped, fingerprints = [], [], {}
+    for files in config:
+        previous = manifest.get(files.client)
+        try:
+            fingerprint = client_fingerprint(files, options, previous)
+        except FileNotFoundError:
+            # Missing exports fail (and are reported) in the merge itself.
+            to_merge.append(files)
+            continue
+        fingerprints[files.client] = fingerprint
+        unchanged = previous is not None and _content(previous) == _content(fingerprint)
+        if unchanged and not force and _outputs_exist(files, options):
+            skipped.append(files)
+        else:
+            to_merge.append(files)
+    return to_merge, skipped, fingerprints
@@ -0,0 +1,131 @@
+import glob
+import os
+from decimal import ROUND_HALF_UP, Decimal
+
+import numpy as np
+import pandas as pd
+
+from src.CallStore import NULL_TIME, CallStore
+from src.csv_processing import round_up_minutes
+from src.utils import format_username
+
+# Charges are exact decimals with this many places, rounded half up.
+CHARGE_SCALE = 4
+PART_ROWS = 1_000_000
+UNKNOWN_MONTH = "unknown"
+
+INT64_MIN, INT64_MAX = np.iinfo(np.int64).min, np.iinfo(np.int64).max
+
+
+def _pyarrow():
+    """pyarrow is optional: only Parquet output needs it."""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as error:
+        raise ImportError("Parquet output needs pyarrow (pip install pyarrow)") from error
+    return pyarrow, pyarrow.parquet
+
+
+def _utc_seconds(frame: pd.DataFrame, name: str, utc_offset: int) -> tuple[np.ndarray, np.ndarray]:
+    """(UTC epoch seconds, missing mask) for one timestamp field; naive times are read at utc_offset."""
+    seconds = frame[name].to_numpy()
+    missing = seconds == NULL_TIME
+    naive = frame[f"{name}_offset"].to_numpy() == 0
+    return np.where(missing, 0, np.where(naive, seconds - utc_offset, seconds)), missing
+
+
+def timezone_name(utc_offset: int) -> str:
+    """"+HH:MM" of a UTC offset in seconds, as Arrow timestamp types name fixed offsets."""
+    sign = "-" if utc_offset < 0 else "+"
+    hours, minutes = divmod(abs(utc_offset) // 60, 60)
+    return f"{sign}{hours:02d}:{minutes:02d}"
+
+
+def _phone_arrays(values: pd.Series):
+    """An int64 column for numeric phone numbers, plus a text column for the rest (e.g. "scancall")."""
+    pa, _ = _pyarrow()
+    numeric = values.map(lambda value: isinstance(value, int) and INT64_MIN <= value <= INT64_MAX).to_numpy(dtype=bool)
+    numbers = np.where(numeric, values.where(numeric, 0).to_numpy(), 0).astype(np.int64)
+    text = [None if is_number else str(value) for value, is_number in zip(values, numeric)]
+    return pa.array(numbers, pa.int64(), mask=~numeric), pa.array(text, pa.string())
+
+
+def _charge(value) -> Decimal:
+    return Decimal(str(value)).quantize(Decimal(1).scaleb(-CHARGE_SCALE), rounding=ROUND_HALF_UP)
+
+
+def parquet_table(store: CallStore, utc_offset: int):
+    """The merged calls as an Arrow table with typed columns; times are in the client's zone (utc_offset seconds)."""
+    pa, _ = _pyarrow()
+    frame = store.to_frame()
+    timestamp_type = pa.timestamp("s", tz=timezone_name(utc_offset))
+    call_from, call_from_text = _phone_arrays(frame["call_from"])
+    call_to, call_to_text = _phone_arrays(frame["call_to"])
+
+    columns = {
+        "sequence_id": pa.array(frame["sequence_id"], pa.string()),
+        "user_name": pa.array(frame["user_name"].map(format_username), pa.string()),
+        "call_from": call_from,
+        "call_from_text": call_from_text,
+        "call_to": call_to,
+        "call_to_text": call_to_text,
+        "call_type": pa.array(frame["call_type"], pa.string()),
+        "number_type": pa.array(frame["number_type"], pa.string()),
+        "iso": pa.array(frame["iso"], pa.string()),
+    }
+    for name in ("dial_start_at", "dial_answered_at", "dial_end_at"):
+        seconds, missing = _utc_seconds(frame, name, utc_offset)
+        columns[name] = pa.array(seconds, timestamp_type, mask=missing)
+    columns.update(
+        {
+            "ringing_seconds": pa.array(frame["ringing_seconds"].to_numpy(), pa.int64()),
+            "duration_seconds": pa.array(frame["duration_seconds"].to_numpy(), pa.int64()),
+            "round_up_minutes": pa.array(round_up_minutes(frame["duration_seconds"].to_numpy()), pa.int64()),
+            "call_memo": pa.array(frame["call_memo"], pa.string()),
+            "call_charge": pa.array(
+                [_charge(value) for value in frame["call_charge"]], pa.decimal128(18, CHARGE_SCALE)
+            ),
+        }
+    )
+    return pa.table(columns)
+
+
+def month_labels(store: CallStore, utc_offset: int) -> np.ndarray:
+    """"YYYY-MM" of each call's start in the client's zone ("unknown" without a start time)."""
+    seconds, missing = _utc_seconds(store.to_frame(), "dial_start_at", utc_offset)
+    labels = pd.Series(pd.to_datetime(seconds + utc_offset, unit="s")).dt.strftime("%Y-%m").to_numpy(dtype=object)
+    labels[missing] = UNKNOWN_MONTH
+    return labels
+
+
+def client_parts(root: str, client: str) -> list[str]:
+    """Parquet files of a client under root, across all months."""
+    return glob.glob(os.path.join(root, "*", f"client={client}", "part-*.parquet"))
+
+
+def save_merged_parquet(store: CallStore, root: str, client: str, utc_offset: int) -> list[str]:
+    """Write the merged calls as <root>/<month>/client=<client>/part-*.parquet; returns the files written.
+
+    Times and months are in the client's zone, utc_offset seconds from UTC.
+
+    Earlier part files of the client are removed first, in every month: a
+    month the client no longer has calls in must not keep its old parts.
+    """
+    _, pq = _pyarrow()
+    print(f"- Saving merged Parquet files under {root}...")
+    table = parquet_table(store, utc_offset)
+    labels = month_labels(store, utc_offset)
+    for stale in client_parts(root, client):
+        os.remove(stale)
+    paths = []
+    for month in sorted(set(labels)):
+        directory = os.path.join(root, month, f"client={client}")
+        os.makedirs(directory, exist_ok=True)
+        rows = np.flatnonzero(labels == month)
+        for part, start in enumerate(range(0, len(rows), PART_ROWS)):
+            path = os.path.join(directory, f"part-{part:05d}.parquet")
+            pq.write_table(table.take(rows[start : start + PART_ROWS]), path)
+            paths.append(path)
+    print(f"- {len(paths)} Parquet files saved")
+    return paths
@@ -0,0 +1,106 @@
+import glob
+import hashlib
+import os
+import pickle
+import tempfile
+from typing import Optional
+
+from src.CallStore import FIELDS, CallStore
+from src.FileConfig import Files
+from src.utils import PBX_REGION_UTC_OFFSETS
+
+# Bump whenever parsing or merging changes what ends up in the store, so older caches are ignored.
+PARSER_VERSION = 4
+# Filled in by rating; never cached, so rate changes always apply.
+RATED_FIELDS = ("iso", "call_charge")
+HASH_BLOCK_BYTES = 1 << 20
+
+
+def file_digest(path: str) -> str:
+    """sha256 of a file's content."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(HASH_BLOCK_BYTES), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_key(files: Files, merge_mode: str) -> str:
+    """Identifies one parsed merge: both exports' content, the parser version and how they were merged.
+
+    The client's pbx_region and the region offsets are part of it: they decide
+    the UTC starts, and so the keys, of what is cached.
+    """
+    offsets = sorted(PBX_REGION_UTC_OFFSETS.items())
+    digest = hashlib.sha256(
+        f"{PARSER_VERSION}\0{files.client}\0{files.carrier}\0{merge_mode}\0{files.pbx_region}\0{offsets}".encode()
+    )
+    for path in (files.dashboard, files.console):
+        digest.update(file_digest(path).encode())
+    return digest.hexdigest()[:32]
+
+
+def _client_prefix(cache_dir: str, client: str) -> str:
+    return os.path.join(cache_dir, client.replace(os.sep, "_") + ".")
+
+
+def cache_path(cache_dir: str, files: Files, key: str) -> str:
+    return f"{_client_prefix(cache_dir, files.client)}{key}.parsed"
+
+
+def pack_store(store: CallStore) -> dict:
+    """The unrated content of a store as plain arrays, for pickling."""
+    return {
+        "keys": store.keys().copy(),
+        "columns": {name: store.column(name).copy() for name in FIELDS if name not in RATED_FIELDS},
+    }
+
+
+def unpack_store(packed: dict, client: str, carrier: str) -> CallStore:
+    """A store rebuilt from pack_store; it picks up the current client config, so changed rates apply."""
+    store = CallStore(client, carrier, capacity=max(len(packed["keys"]), 1))
+    store.upsert(packed["keys"], packed["columns"], {})
+    return store
+
+
+def read_pickle(path: str) -> Optional[dict]:
+    """A pickled dict, or None when the file is missing or unreadable."""
+    try:
+        with open(path, "rb") as pickle_file:
+            return pickle.load(pickle_file)
+    except FileNotFoundError:
+        return None
+    except (pickle.UnpicklingError, EOFError, ValueError) as error:
+        print(f"- Ignoring unreadable {path}: {error}")
+        return None
+
+
+def write_pickle(path: str, value: dict) -> None:
+    """Pickle to a temporary file first, so an interrupted run never leaves half a file behind."""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    handle, temp_path = tempfile.mkstemp(suffix=".tmp", dir=directory)
+    with os.fdopen(handle, "wb") as pickle_file:
+        pickle.dump(value, pickle_file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, path)
+
+
+def load_parsed_store(cache_dir: str, files: Files, key: str) -> Optional[CallStore]:
+    """The merged, unrated store cached under key, or None on a miss."""
+    path = cache_path(cache_dir, files, key)
+    cached = read_pickle(path)
+    if cached is None or cached.get("version") != PARSER_VERSION:
+        return None
+    print(f"- Using parsed calls from {path}")
+    return unpack_store(cached, files.client, files.carrier)
+
+
+def save_parsed_store(cache_dir: str, files: Files, key: str, store: CallStore) -> str:
+    """Cache a merged store before rating; replaces older caches of the same client."""
+    path = cache_path(cache_dir, files, key)
+    write_pickle(path, {"version": PARSER_VERSION, **pack_store(store)})
+    for stale in glob.glob(glob.escape(_client_prefix(cache_dir, files.client)) + "?" * len(key) + ".parsed"):
+        if stale != path:
+            os.remove(stale)
+    print(f"- Parsed calls cached to {path}")
+    return path
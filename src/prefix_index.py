@@ -0,0 +1,90 @@
+import ast
+import inspect
+from types import ModuleType
+from typing import Any, Optional
+
+
+class PrefixIndex:
+    """Longest-prefix-match lookup over a {prefix: label} table.
+
+    Prefixes are stored as digit strings in one dict; a lookup tries each
+    distinct prefix length once, longest first, so it costs at most
+    len(number) dict probes instead of a scan over the whole table.
+    """
+
+    def __init__(self, table: dict):
+        self._labels: dict[str, Any] = {}
+        for prefix, label in table.items():
+            self._labels[str(prefix).replace("+", "")] = label
+        self._lengths = sorted({len(prefix) for prefix in self._labels}, reverse=True)
+        self.conflicts: dict[Any, list] = {}
+
+    def __len__(self) -> int:
+        return len(self._labels)
+
+    def longest_match(self, number: str) -> Optional[str]:
+        """Return the longest prefix of number present in the table, or None."""
+        labels = self._labels
+        for length in self._lengths:
+            if length <= len(number) and number[:length] in labels:
+                return number[:length]
+        return None
+
+    def lookup(self, number: str, default=None):
+        prefix = self.longest_match(number)
+        return default if prefix is None else self._labels[prefix]
+
+
+def find_dict_literal(module: ModuleType, table_name: str) -> Optional[ast.Dict]:
+    """The dict literal assigned to table_name at the top level of module's source."""
+    tree = ast.parse(inspect.getsource(module))
+    for node in tree.body:
+        if isinstance(node, ast.Assign):
+            targets = node.targets
+        elif isinstance(node, ast.AnnAssign):
+            targets = [node.target]
+        else:
+            continue
+        if any(isinstance(target, ast.Name) and target.id == table_name for target in targets):
+            if isinstance(node.value, ast.Dict):
+                return node.value
+    return None
+
+
+def conflicting_keys(dict_node: ast.Dict) -> dict[Any, list]:
+    """Keys written more than once with different values, as {key: [value, ...]} in source order."""
+    seen: dict[Any, list] = {}
+    for key_node, value_node in zip(dict_node.keys, dict_node.values):
+        if key_node is None:  # {**other}
+            continue
+        try:
+            key, value = ast.literal_eval(key_node), ast.literal_eval(value_node)
+        except ValueError:
+            continue
+        seen.setdefault(key, []).append(value)
+    return {key: values for key, values in seen.items() if len(set(map(repr, values))) > 1}
+
+
+def find_conflicting_keys(module: ModuleType, table_name: str) -> dict[Any, list]:
+    """Conflicting duplicate keys in the dict literal module.table_name.
+
+    Python silently keeps the last value of a duplicated key, so this reads the
+    module source instead of the built dict.
+    """
+    dict_node = find_dict_literal(module, table_name)
+    return conflicting_keys(dict_node) if dict_node is not None else {}
+
+
+def compile_prefix_index(table: dict, module: Optional[ModuleType] = None, table_name: str = "") -> PrefixIndex:
+    """Build a PrefixIndex for table, recording duplicate keys found in its source."""
+    index = PrefixIndex(table)
+    if module is not None and table_name:
+        index.conflicts = find_conflicting_keys(module, table_name)
+    return index
+
+
+def format_conflicts(table_name: str, conflicts: dict[Any, list]) -> list[str]:
+    return [
+        f"! {table_name}: prefix {key} is listed as {' and '.join(map(str, values))}; using {values[-1]}"
+        for key, values in conflicts.items()
+    ]
@@ -0,0 +1,186 @@
+import io
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import redirect_stdout
+from dataclasses import dataclass
+from typing import Optional, Sequence
+
+from src.CallDetail import CallDetail
+from src.CallStore import CallStore
+from src.FileConfig import Files
+from src.external_merge import merge_files_out_of_core
+from src.incremental import DEFAULT_OVERLAP_HOURS, merge_incremental
+from src.csv_processing import (
+    finalize_calls,
+    finalize_store,
+    join_console_store,
+    load_dashboard_store,
+    merge_console_store,
+    process_console_csv,
+    process_dashboard_csv,
+    save_merged_csv,
+    save_store_csv,
+)
+from src.parquet_output import save_merged_parquet
+from src.parse_cache import cache_key, load_parsed_store, save_parsed_store
+from src.utils import PBX_REGION_UTC_OFFSETS, peak_rss_mb
+
+
+@dataclass
+class ClientResult:
+    client: str
+    seconds: float
+    # The process that merged the client, and its peak RSS so far: a high-water
+    # mark of the whole process (pool workers are reused), not of this client.
+    pid: int
+    peak_rss_mb: Optional[float] = None
+
+
+def _result(files: Files, started: float) -> ClientResult:
+    return ClientResult(files.client, time.perf_counter() - started, os.getpid(), peak_rss_mb())
+
+
+class PrefixedWriter(io.TextIOBase):
+    """Text stream that starts every line with a prefix and writes whole lines.
+
+    Workers of a process pool share the terminal; prefixing each line with the
+    client name (and writing it in one go) keeps interleaved output readable.
+    """
+
+    def __init__(self, stream, prefix: str):
+        self.stream = stream
+        self.prefix = prefix
+        self._pending = ""
+
+    def write(self, text: str) -> int:
+        lines = (self._pending + text).split("\n")
+        self._pending = lines.pop()
+        for line in lines:
+            self.stream.write(f"{self.prefix}{line}\n")
+            self.stream.flush()
+        return len(text)
+
+    def flush(self) -> None:
+        if self._pending:
+            self.stream.write(f"{self.prefix}{self._pending}")
+            self._pending = ""
+        self.stream.flush()
+
+
+def merge_client(
+    files: Files,
+    columnar: bool = False,
+    chunk_rows: Optional[int] = None,
+    store: bool = False,
+    join: bool = False,
+    match_tolerance: Optional[int] = None,
+    memory_budget: Optional[float] = None,
+    parquet_root: Optional[str] = None,
+    parse_cache: Optional[str] = None,
+    incremental: Optional[str] = None,
+    overlap_hours: float = DEFAULT_OVERLAP_HOURS,
+) -> ClientResult:
+    started = time.perf_counter()
+    print(f"> Merging files for client {files.client}")
+    if memory_budget:
+        merge_files_out_of_core(files, memory_budget)
+        if parquet_root:
+            print("- Parquet output is not available with a memory budget, only the CSV was written")
+        return _result(files, started)
+
+    if incremental:
+        if join or match_tolerance is not None or parse_cache or chunk_rows:
+            print("- Incremental merges ignore --join, --match-tolerance, --parse-cache and --chunk-rows")
+        call_store = merge_incremental(files, incremental, overlap_hours=overlap_hours)
+        _save_store(call_store, files, parquet_root)
+        return _result(files, started)
+
+    join = join or match_tolerance is not None
+    if parse_cache:
+        key = cache_key(files, f"join:{match_tolerance}" if join else "merge")
+        call_store = load_parsed_store(parse_cache, files, key)
+        if call_store is None:
+            call_store = _merge_into_store(files, chunk_rows, join, match_tolerance)
+            save_parsed_store(parse_cache, files, key, call_store)
+        _save_store(call_store, files, parquet_root)
+        return _result(files, started)
+
+    if store or join:
+        call_store = _merge_into_store(files, chunk_rows, join, match_tolerance)
+        _save_store(call_store, files, parquet_root)
+        return _result(files, started)
+
+    call_details = _merge_call_details(files, columnar, chunk_rows)
+    finalize_calls(call_details)
+    save_merged_csv(call_details, files.output)
+    if parquet_root:
+        call_store = CallStore.from_call_details(call_details, client=files.client, carrier=files.carrier)
+        save_merged_parquet(call_store, parquet_root, files.client, PBX_REGION_UTC_OFFSETS[files.pbx_region])
+    return _result(files, started)
+
+
+def _merge_call_details(files: Files, columnar: bool, chunk_rows: Optional[int]) -> dict[str, CallDetail]:
+    call_details = process_dashboard_csv(files.dashboard, files.carrier, client=files.client, columnar=columnar)
+    return process_console_csv(files.console, files.carrier, call_details, client=files.client, chunk_rows=chunk_rows)
+
+
+def _merge_into_store(files: Files, chunk_rows: Optional[int], join: bool, match_tolerance: Optional[int]) -> CallStore:
+    """Both exports merged into a CallStore, not rated yet."""
+    call_store = load_dashboard_store(files.dashboard, files.carrier, client=files.client)
+    if join:
+        if chunk_rows:
+            print("- The join reads the console export at once, --chunk-rows is ignored")
+        join_console_store(files.console, call_store, tolerance_seconds=match_tolerance)
+    else:
+        merge_console_store(files.console, call_store, chunk_rows=chunk_rows)
+    return call_store
+
+
+def _save_store(call_store: CallStore, files: Files, parquet_root: Optional[str]) -> None:
+    finalize_store(call_store)
+    save_store_csv(call_store, files.output)
+    if parquet_root:
+        save_merged_parquet(call_store, parquet_root, files.client, PBX_REGION_UTC_OFFSETS[files.pbx_region])
+
+
+def _merge_client_in_worker(files: Files, options: dict) -> ClientResult:
+    with redirect_stdout(PrefixedWriter(sys.stdout, f"[{files.client}] ")):
+        return merge_client(files, **options)
+
+
+def merge_clients(config: list[Files], workers: int = 1, **options) -> list[ClientResult]:
+    """Merge every client, either in this process or spread over a process pool."""
+    if workers <= 1:
+        return [merge_client(files, **options) for files in config]
+
+    # Results are reported in config order regardless of completion order.
+    results: list[Optional[ClientResult]] = [None] * len(config)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(_merge_client_in_worker, files, options): position
+            for position, files in enumerate(config)
+        }
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+    return results
+
+
+def print_summary(results: list[ClientResult], wall_seconds: float, skipped: Sequence[str] = ()) -> None:
+    print(f"Summary ({len(results)} clients merged, {len(skipped)} unchanged and skipped; wall time per client):")
+    width = max((len(name) for name in [*(result.client for result in results), *skipped]), default=0)
+    for result in results:
+        print(f"  {result.client.ljust(width)}  {result.seconds:8.1f}s")
+    for client in skipped:
+        print(f"  {client.ljust(width)}  {'skipped':>9}")
+    print(f"  {'total'.ljust(width)}  {wall_seconds:8.1f}s")
+
+    # Peak RSS only means something per process; this process's own is printed by the caller.
+    workers: dict[int, list[ClientResult]] = {}
+    for result in results:
+        if result.pid != os.getpid() and result.peak_rss_mb is not None:
+            workers.setdefault(result.pid, []).append(result)
+    for pid, worker_results in workers.items():
+        peak = max(result.peak_rss_mb for result in worker_results)
+        print(f"  worker {pid}: peak RSS {peak:.1f} MB over {len(worker_results)} clients")
@@ -0,0 +1,105 @@
+from dataclasses import dataclass, field
+from typing import Iterator
+
+import pandas as pd
+
+from src.columnar import parse_duration_column
+
+
+@dataclass(frozen=True)
+class ReadSchema:
+    """Columns an export is read with, and the type each one should arrive as.
+
+    Columns not listed are never materialized. Text columns keep the "nan"
+    convention for empty cells, durations arrive as int64 seconds and numeric
+    columns as float64.
+    """
+
+    text_columns: tuple[str, ...]
+    duration_columns: tuple[str, ...] = ()
+    numeric_columns: tuple[str, ...] = ()
+    # Read when present, but not every export has them.
+    optional_columns: tuple[str, ...] = field(default=())
+
+    @property
+    def columns(self) -> tuple[str, ...]:
+        return self.text_columns + self.duration_columns + self.numeric_columns + self.optional_columns
+
+
+DASHBOARD_SCHEMA = ReadSchema(
+    text_columns=(
+        "Sequence ID",
+        "User name",
+        "Call from",
+        "Call to",
+        "Call type",
+        "Dial begin time",
+        "Call begin time",
+        "Call end time",
+        "Call memo",
+    ),
+    duration_columns=("Ringing time", "Call duration"),
+)
+
+CONSOLE_SCHEMA = ReadSchema(
+    text_columns=(
+        "call_id",
+        "used_number",
+        "number",
+        "call_type",
+        "dial_starts_at",
+        "dial_answered_at",
+        "dial_ends_at",
+        "pbx_region",
+        "number_type",
+    ),
+    duration_columns=("all_duration_of_call_sec_str", "duration_of_call_sec_str"),
+    numeric_columns=("discount",),
+)
+
+MERGED_SCHEMA = ReadSchema(
+    text_columns=(
+        "User name",
+        "Call from",
+        "Call to",
+        "Call type",
+        "Dial starts at",
+        "Dial answered at",
+        "Dial ends at",
+        "Call memo",
+    ),
+    duration_columns=("Ringing time", "Call duration"),
+    numeric_columns=("Call charge",),
+    optional_columns=("call_id", "Sequence ID"),
+)
+
+
+def apply_schema(df: pd.DataFrame, schema: ReadSchema) -> pd.DataFrame:
+    missing = [column for column in schema.text_columns + schema.duration_columns if column not in df.columns]
+    if missing:
+        raise KeyError(f"Missing columns in export: {', '.join(missing)}")
+
+    for column in schema.text_columns + schema.optional_columns:
+        if column in df.columns:
+            df[column] = df[column].astype(str)
+    for column in schema.duration_columns:
+        df[column] = parse_duration_column(df[column])
+    for column in schema.numeric_columns:
+        if column in df.columns:
+            df[column] = pd.to_numeric(df[column], errors="coerce")
+    return df
+
+
+def read_export(file_path: str, schema: ReadSchema) -> pd.DataFrame:
+    df = pd.read_csv(file_path, usecols=lambda column: column in schema.columns, dtype=str, low_memory=False)
+    return apply_schema(df, schema)
+
+
+def read_raw_chunks(file_path: str, schema: ReadSchema, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    """The schema's columns as unparsed text, chunk_rows rows at a time (the index keeps counting across chunks)."""
+    return pd.read_csv(file_path, usecols=lambda column: column in schema.columns, dtype=str, chunksize=chunk_rows)
+
+
+def read_export_chunks(file_path: str, schema: ReadSchema, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    for chunk in read_raw_chunks(file_path, schema, chunk_rows):
+        yield apply_schema(chunk, schema)
@@ -0,0 +1,400 @@
+import ast
+import weakref
+from dataclasses import dataclass, fields
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from src import international_rates
+from src.FileConfig import Files
+from src.idn_area_codes import EMERGENCY_NUMBERS
+from src.international_rates import INTERNATIONAL_RATES
+from src.prefix_index import conflicting_keys, find_dict_literal
+from src.utils import classification_labels
+
+DEFAULT_RATE_CARRIER = "Atlasat"
+
+
+def normalize_iso_label(label: Optional[str]) -> str:
+    """Case- and whitespace-insensitive form of an ISO label, used as the rate key."""
+    return " ".join(label.lower().split()) if label else ""
+
+
+def compile_rate_table(carrier: str, rates: dict, reachable: set[str]) -> tuple[dict[str, float], list[str]]:
+    """Exact-match {normalized ISO label: rate} map for one carrier, plus warnings.
+
+    Keys that normalize to the same label keep the last rate, like a duplicated
+    dict key would. Keys classify_number can never produce, and labels the old
+    substring match would have resolved to more than one key, are reported.
+    """
+    table = f"INTERNATIONAL_RATES[{carrier}]"
+    compiled: dict[str, float] = {}
+    original_keys: dict[str, str] = {}
+    warnings = []
+
+    for key, rate in rates.items():
+        label = normalize_iso_label(key)
+        if label in compiled and compiled[label] != rate:
+            warnings.append(
+                f"! {table}: {key!r} is the same label as {original_keys[label]!r}; using {rate} over {compiled[label]}"
+            )
+        compiled[label] = rate
+        original_keys[label] = key
+
+    for label, key in original_keys.items():
+        if label not in reachable:
+            warnings.append(f"! {table}: {key!r} never matches a classified number")
+
+    for label in sorted(reachable):
+        matches = [key for key in compiled if key in label or label in key]
+        if len(matches) > 1:
+            warnings.append(f"! {table}: {label!r} is ambiguous between {matches}; only the exact key applies")
+
+    return compiled, warnings
+
+
+def duplicate_rate_warnings() -> list[str]:
+    """Keys listed twice inside one carrier's literal; the built dict only keeps the last."""
+    rates_node = find_dict_literal(international_rates, "INTERNATIONAL_RATES")
+    if rates_node is None:
+        return []
+
+    warnings = []
+    for carrier_node, carrier_rates_node in zip(rates_node.keys, rates_node.values):
+        if carrier_node is None or not isinstance(carrier_rates_node, ast.Dict):
+            continue
+        carrier = ast.literal_eval(carrier_node)
+        for key, values in conflicting_keys(carrier_rates_node).items():
+            warnings.append(
+                f"! INTERNATIONAL_RATES[{carrier}]: {key!r} is listed as "
+                f"{' and '.join(map(str, values))}; using {values[-1]}"
+            )
+    return warnings
+
+
+def compile_international_rates(rates: dict = INTERNATIONAL_RATES) -> tuple[dict[str, dict[str, float]], list[str]]:
+    reachable = {normalize_iso_label(label) for label in classification_labels()}
+    tables, warnings = {}, duplicate_rate_warnings() if rates is INTERNATIONAL_RATES else []
+    for carrier, carrier_rates in rates.items():
+        tables[carrier], carrier_warnings = compile_rate_table(carrier, carrier_rates, reachable)
+        warnings.extend(carrier_warnings)
+    return tables, warnings
+
+
+# Compiled once per process; rating an international call is one dict lookup.
+INTERNATIONAL_RATE_TABLES, RATE_TABLE_WARNINGS = compile_international_rates()
+
+
+def rate_table_for(carrier: str) -> dict[str, float]:
+    return INTERNATIONAL_RATE_TABLES.get(carrier.title(), INTERNATIONAL_RATE_TABLES[DEFAULT_RATE_CARRIER])
+
+
+def international_rate(carrier: str, iso: Optional[str]) -> Optional[float]:
+    return rate_table_for(carrier).get(normalize_iso_label(iso))
+
+
+# Callers that are never charged for siemens-id.
+SPECIAL_ZERO_CHARGE_CALLERS = frozenset(
+    {"2150913403", "85161662298", "85157455618", "82248400487", "2150913400", "2131141271"}
+)
+DEFAULT_CHARGEABLE_CALL_TYPES = ("outbound call", "predictive dialer")
+S2C_CALL_TYPES = frozenset({"incoming call", "answering machine"})
+PREMIUM_LABELS = frozenset({"premium call", "toll-free", "split charge"}) | frozenset(EMERGENCY_NUMBERS.values())
+RATE_TYPES = ("per_minute", "per_second")
+FALLBACK_RATE = 720
+PREMIUM_RATE = 1700
+# Added to premium and international rates of end-user clients.
+ENDUSER_SURCHARGE = 200
+# Everything above that decides a charge besides the config entry and the rate tables.
+TARIFF_CONSTANTS = {
+    "special_zero_charge_callers": sorted(SPECIAL_ZERO_CHARGE_CALLERS),
+    "default_chargeable_call_types": DEFAULT_CHARGEABLE_CALL_TYPES,
+    "s2c_call_types": sorted(S2C_CALL_TYPES),
+    "premium_labels": sorted(PREMIUM_LABELS),
+    "rate_types": RATE_TYPES,
+    "fallback_rate": FALLBACK_RATE,
+    "premium_rate": PREMIUM_RATE,
+    "enduser_surcharge": ENDUSER_SURCHARGE,
+}
+
+# A resolved rule: (rate, "per_minute" | "per_second").
+Rule = tuple[float, str]
+
+
+@dataclass(frozen=True)
+class NumberRule:
+    number: Optional[str]
+    call_types: frozenset
+    rate: float
+    rate_type: str
+
+
+@dataclass(frozen=True)
+class CompiledTariff:
+    """Everything calculate_call_charge needs from one Files entry, precomputed.
+
+    Built once per client; resolve() walks the same rules in the same order as
+    the original if-chain but only does set and dict lookups.
+    """
+
+    client: str
+    is_enduser: bool
+    zero_charge_callers: frozenset
+    international_rates: dict
+    s2c_numbers: frozenset
+    s2c_rule: Optional[Rule]
+    chargeable_types: frozenset
+    number_rules: tuple[NumberRule, ...]
+    general_types: frozenset
+    general_rule: Optional[Rule]
+    fallback_rule: Rule
+
+    def resolve(self, call_type: str, iso: str, call_from: str, call_to: str) -> Rule:
+        """Rate and rate type for one call; arguments already stripped and lowercased."""
+        if call_from in self.zero_charge_callers:
+            return 0, "per_minute"
+        if iso == "internal call":
+            return 0, "per_minute"
+        if iso in PREMIUM_LABELS:
+            return PREMIUM_RATE + (ENDUSER_SURCHARGE if self.is_enduser else 0), "per_minute"
+
+        base_rate = self.international_rates.get(normalize_iso_label(iso))
+        if base_rate is not None:
+            return base_rate + (ENDUSER_SURCHARGE if self.is_enduser else 0), "per_minute"
+
+        if self.s2c_rule is not None and ((call_to or call_from) in self.s2c_numbers or iso == "scancall"):
+            if call_type in S2C_CALL_TYPES or call_type in self.chargeable_types:
+                return self.s2c_rule
+
+        for number_rule in self.number_rules:
+            if call_type in number_rule.call_types and number_rule.number in (call_to, call_from):
+                return number_rule.rate, number_rule.rate_type
+
+        if self.general_rule is not None and (not self.general_types or call_type in self.general_types):
+            return self.general_rule
+        if call_type in self.chargeable_types:
+            return self.fallback_rule
+        return 0, "per_minute"
+
+    def resolve_call(self, call_type, iso, call_from, call_to) -> Rule:
+        """resolve() for raw CallDetail fields (normalizes them first, exactly as resolve_batch does)."""
+        return self.resolve(_call_type(call_type), _iso(iso), _field(call_from), _field(call_to))
+
+
+def compile_tariff(files: Files) -> CompiledTariff:
+    s2c_numbers = files.s2c if isinstance(files.s2c, list) else [files.s2c]
+    s2c_rule = (files.s2c_rate, files.s2c_rate_type) if files.s2c_rate_type in RATE_TYPES else None
+
+    number_rules = []
+    for number, rate, rate_type, call_types in (
+        (files.number1, files.number1_rate, files.number1_rate_type, files.number1_chargeable_call_types),
+        (files.number2, files.number2_rate, files.number2_rate_type, files.number2_chargeable_call_types),
+    ):
+        rate_type = rate_type or "per_minute"
+        if rate_type not in RATE_TYPES:
+            continue
+        number_rules.append(
+            NumberRule(
+                number=number,
+                call_types=frozenset(call_type.lower() for call_type in (call_types or [])),
+                rate=(rate or 0) or FALLBACK_RATE,
+                rate_type=rate_type,
+            )
+        )
+
+    general_types = frozenset(call_type.lower() for call_type in files.chargeable_call_types)
+    general_rule = (files.rate, files.rate_type) if files.rate_type in RATE_TYPES else None
+    fallback_rate = files.rate if files.rate is not None else FALLBACK_RATE
+    fallback_rule = (fallback_rate, "per_second" if files.rate_type == "per_second" else "per_minute")
+
+    return CompiledTariff(
+        client=files.client,
+        is_enduser="enduser" in files.client.lower(),
+        zero_charge_callers=SPECIAL_ZERO_CHARGE_CALLERS if files.client == "siemens-id" else frozenset(),
+        international_rates=rate_table_for(files.carrier),
+        s2c_numbers=frozenset(s2c_numbers),
+        s2c_rule=s2c_rule,
+        chargeable_types=general_types or frozenset(DEFAULT_CHARGEABLE_CALL_TYPES),
+        number_rules=tuple(number_rules),
+        general_types=general_types,
+        general_rule=general_rule,
+        fallback_rule=fallback_rule,
+    )
+
+
+_TARIFFS: dict[tuple, CompiledTariff] = {}
+# id -> (weak reference, tariff) of entries already looked up, so rating a call
+# does not rebuild the content key. The weak reference tells a reused id apart.
+_KNOWN_ENTRIES: dict[int, tuple[weakref.ref, CompiledTariff]] = {}
+
+
+def _entry_key(files: Files) -> tuple:
+    """Every field of a Files entry, hashable: equal entries share one compiled tariff."""
+    values = (getattr(files, field.name) for field in fields(files))
+    return tuple(tuple(value) if isinstance(value, list) else value for value in values)
+
+
+def tariff_for(files: Files) -> CompiledTariff:
+    """The compiled tariff for a Files entry, built on first use and reused for the run.
+
+    Cached by the entry's content, not its identity, so a rebuilt or
+    replaced entry with other rates never picks up a stale tariff. Entries
+    are not expected to change in place once calls are rated.
+    """
+    known = _KNOWN_ENTRIES.get(id(files))
+    if known is not None and known[0]() is files:
+        return known[1]
+    key = _entry_key(files)
+    tariff = _TARIFFS.get(key)
+    if tariff is None:
+        tariff = _TARIFFS[key] = compile_tariff(files)
+    _KNOWN_ENTRIES[id(files)] = (weakref.ref(files), tariff)
+    return tariff
+
+
+class _Column:
+    """A text column factorized into codes and distinct values.
+
+    Per-call normalization and set membership are evaluated once per distinct
+    value and broadcast back through the codes.
+    """
+
+    def __init__(self, values, normalize):
+        codes, uniques = pd.factorize(pd.Series(values, dtype=object), use_na_sentinel=False)
+        self.codes = codes
+        # factorize folds None into NaN; the normalizers treat both as "no value".
+        self.values = [normalize(value) for value in uniques]
+
+    def where(self, predicate) -> np.ndarray:
+        return np.array([predicate(value) for value in self.values], dtype=bool)[self.codes]
+
+    def isin(self, members) -> np.ndarray:
+        return self.where(lambda value: value in members)
+
+    def equals(self, other) -> np.ndarray:
+        return self.where(lambda value: value == other)
+
+
+# Field normalizers shared by CompiledTariff.resolve_call and resolve_batch.
+def _present(value):
+    """value, or "" for a missing one (None, NaN or pd.NA)."""
+    if value is None or value is pd.NA or (isinstance(value, float) and value != value):
+        return ""
+    return value
+
+
+def _field(value) -> str:
+    return str(_present(value) or "").strip()
+
+
+def _call_type(value) -> str:
+    return (_present(value) or "").strip().lower()
+
+
+def _iso(value) -> str:
+    value = _present(value)
+    return value.lower() if value else ""
+
+
+def resolve_batch(
+    tariff: Optional[CompiledTariff], call_type, iso, call_from, call_to
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Vectorized CompiledTariff.resolve.
+
+    Returns (rate, per_second, integral) arrays: the rate each call is charged
+    at, whether it is a per-second rate, and whether the rate was an int (the
+    per-call path then produces an int charge).
+    """
+    call_type = _Column(call_type, _call_type)
+    iso = _Column(iso, _iso)
+    call_from = _Column(call_from, _field)
+    call_to = _Column(call_to, _field)
+
+    size = len(call_type.codes)
+    rate = np.zeros(size, dtype=np.float64)
+    per_second = np.zeros(size, dtype=bool)
+    integral = np.ones(size, dtype=bool)
+    pending = np.ones(size, dtype=bool)
+
+    def apply(mask, rule_rate, rule_type: str = "per_minute", rule_integral=None):
+        mask = mask & pending
+        if not mask.any():
+            return
+        if isinstance(rule_rate, np.ndarray):
+            rate[mask] = rule_rate[mask]
+            integral[mask] = rule_integral[mask]
+        else:
+            rate[mask] = float(rule_rate)
+            integral[mask] = isinstance(rule_rate, int)
+        per_second[mask] = rule_type == "per_second"
+        pending[mask] = False
+
+    if tariff is None:
+        apply(pending.copy(), FALLBACK_RATE)
+        return rate, per_second, integral
+
+    apply(call_from.isin(tariff.zero_charge_callers), 0)
+    apply(iso.equals("internal call"), 0)
+    apply(iso.isin(PREMIUM_LABELS), PREMIUM_RATE + (ENDUSER_SURCHARGE if tariff.is_enduser else 0))
+
+    rates = tariff.international_rates
+    extra = ENDUSER_SURCHARGE if tariff.is_enduser else 0
+    labels = [normalize_iso_label(value) for value in iso.values]
+    international_rate = np.array([rates.get(label, 0) + extra for label in labels], dtype=np.float64)
+    international_integral = np.array([isinstance(rates.get(label), int) for label in labels], dtype=bool)
+    apply(
+        np.array([label in rates for label in labels], dtype=bool)[iso.codes],
+        international_rate[iso.codes],
+        rule_integral=international_integral[iso.codes],
+    )
+
+    if tariff.s2c_rule is not None:
+        to_present = call_to.where(bool)
+        s2c_target = np.where(to_present, call_to.isin(tariff.s2c_numbers), call_from.isin(tariff.s2c_numbers))
+        s2c_call = s2c_target | iso.equals("scancall")
+        s2c_type = call_type.where(lambda value: value in S2C_CALL_TYPES or value in tariff.chargeable_types)
+        apply(s2c_call & s2c_type, *tariff.s2c_rule)
+
+    for number_rule in tariff.number_rules:
+        on_number = call_to.equals(number_rule.number) | call_from.equals(number_rule.number)
+        apply(call_type.isin(number_rule.call_types) & on_number, number_rule.rate, number_rule.rate_type)
+
+    if tariff.general_rule is not None:
+        if tariff.general_types:
+            apply(call_type.isin(tariff.general_types), *tariff.general_rule)
+        else:
+            apply(pending.copy(), *tariff.general_rule)
+    apply(call_type.isin(tariff.chargeable_types), *tariff.fallback_rule)
+    apply(pending.copy(), 0)
+    return rate, per_second, integral
+
+
+def charges_for(duration_seconds, rate: np.ndarray, per_second: np.ndarray) -> np.ndarray:
+    """Per-minute (rounded up) or per-second charge for each call."""
+    seconds = np.asarray(duration_seconds, dtype=np.int64)
+    minutes = -(-seconds // 60)
+    return np.where(per_second, seconds * rate, minutes * rate)
+
+
+def rate_batch(files: Optional[Files], duration_seconds, call_type, iso, call_from, call_to) -> np.ndarray:
+    """Charges for a batch of calls of one client, as a float64 array.
+
+    Each element equals float(CallDetail.calculate_call_charge()) for the same
+    call; use charge_values to get the exact values the per-call path returns.
+    """
+    tariff = tariff_for(files) if files else None
+    rate, per_second, _ = resolve_batch(tariff, call_type, iso, call_from, call_to)
+    return charges_for(duration_seconds, rate, per_second)
+
+
+def charge_values(charges: np.ndarray, integral: np.ndarray) -> list[int | float]:
+    """Charges typed like minutes * rate: ints where the rate was an int, floats otherwise."""
+    return [int(charge) if whole else charge for charge, whole in zip(charges.tolist(), integral.tolist())]
+
+
+def rate_batch_values(files: Optional[Files], duration_seconds, call_type, iso, call_from, call_to) -> list[int | float]:
+    """rate_batch, typed exactly as CallDetail.call_charge."""
+    tariff = tariff_for(files) if files else None
+    rate, per_second, integral = resolve_batch(tariff, call_type, iso, call_from, call_to)
+    return charge_values(charges_for(duration_seconds, rate, per_second), integral & ~per_second)
@@ -1,46 +1,84 @@
-from datetime import datetime, timedelta, timezone
+import hashlib
+import sys
+from datetime import datetime, timedelta, timezone, tzinfo
 from typing import Optional
-from dateutil.parser import parse
-import pytz
 
+from src import idn_area_codes
+from src.FileConfig import Files
 from src.idn_area_codes import EMERGENCY_NUMBERS, PHONE_PREFIXES, INTERNATIONAL_PHONE_PREFIXES
+from src.prefix_index import compile_prefix_index, format_conflicts
 
 SPECIAL_PREFIXES = [211500, 211400, 21150, 21140, 1500, 1400, 800, 84, 31, 21, 8]
 
-def call_hash(call_from: str, call_to: str, dial_start_at) -> str:
-    # Accept str or datetime
-    if isinstance(dial_start_at, str):
-        dt = parse(dial_start_at)
-    elif isinstance(dial_start_at, datetime):
-        dt = dial_start_at
-    else:
-        raise ValueError(f"Unsupported type for dial_start_at: {type(dial_start_at)}")
+# Compiled once per process; classify_number does a longest-prefix match against these.
+PHONE_PREFIX_INDEX = compile_prefix_index(PHONE_PREFIXES, idn_area_codes, "PHONE_PREFIXES")
+INTERNATIONAL_PREFIX_INDEX = compile_prefix_index(
+    INTERNATIONAL_PHONE_PREFIXES, idn_area_codes, "INTERNATIONAL_PHONE_PREFIXES"
+)
+
+# Keys of calls without a sequence ID: this prefix, then a 64-bit digest in hex.
+CALL_HASH_PREFIX = "#"
+CALL_HASH_BYTES = 8
+
+# Keys of calls with neither a sequence ID nor a start time: this prefix, the export and the row.
+UNKEYED_CALL_PREFIX = "!"
+
+def call_hash(call_from: int | str, call_to: int | str, start_seconds: Optional[int]) -> Optional[str]:
+    """Merge key of a call without a sequence ID, from its parsed numbers and start (UTC epoch seconds).
+
+    Callers convert the start to UTC first: console times are UTC, naive
+    dashboard times are wall-clock time of the client's pbx_region (see
+    client_timezone). So a call seen by both exports gets the same key.
+    None without a start: see unkeyed_call_key.
+    """
+    if start_seconds is None:
+        return None
+    digest = hashlib.blake2b(f"{call_from}|{call_to}|{start_seconds}".encode(), digest_size=CALL_HASH_BYTES)
+    return CALL_HASH_PREFIX + digest.hexdigest()
+
+def unkeyed_call_key(source: str, row: int) -> str:
+    """Key of a call with neither a sequence ID nor a start time: its export and row, so it stays a call of its own."""
+    return f"{UNKEYED_CALL_PREFIX}{source}:{row}"
+
+def print_unkeyed_rows(count: int, source: str) -> None:
+    if count:
+        print(f"- {count} {source} rows have neither a sequence ID nor a start time; each is kept as its own call")
 
-    # Normalize to UTC + remove microseconds + round to seconds
-    if dt.tzinfo is None:
-        dt = dt.replace(tzinfo=pytz.UTC)
-    dt = dt.astimezone(pytz.UTC)
-    dt = dt.replace(microsecond=0)
+# UTC offset (seconds) of the local time calls of each console pbx_region are shown in.
+# Supporting a new region only takes an entry here.
+PBX_REGION_UTC_OFFSETS = {"jkt": 7 * 3600}
+PBX_REGION_TIMEZONES = {
+    region: timezone(timedelta(seconds=offset)) for region, offset in PBX_REGION_UTC_OFFSETS.items()
+}
 
-    normalized_iso = dt.isoformat()
-    return f"{call_from}|{call_to}|{normalized_iso}"
+def unsupported_region(region: str) -> Exception:
+    return Exception(f"Timezone not supported for pbx_region {region!r}. Add it to PBX_REGION_UTC_OFFSETS.")
+
+def pbx_timezone(region: str) -> tzinfo:
+    """Fixed-offset timezone of a pbx_region."""
+    local_timezone = PBX_REGION_TIMEZONES.get(region)
+    if local_timezone is None:
+        raise unsupported_region(region)
+    return local_timezone
+
+def client_timezone(files: Optional[Files]) -> tzinfo:
+    """Timezone a client's dashboard times are recorded in (Jakarta for a client not in the config)."""
+    return pbx_timezone(files.pbx_region if files is not None else Files.pbx_region)
+
+def localize(value: Optional[datetime], local_timezone: tzinfo) -> Optional[datetime]:
+    """A naive wall-clock time read as local time in local_timezone; aware values and None pass through."""
+    if value is None or value.tzinfo is not None:
+        return value
+    return value.replace(tzinfo=local_timezone)
 
 def convert_to_jakarta_time_iso(original_date_str: str, region: str) -> datetime:
-    if region != "jkt":
-        raise Exception(
-            "Timezone not supported. Only Jakarta time is supported for now."
-        )
+    local_timezone = PBX_REGION_TIMEZONES.get(region)
+    if local_timezone is None:
+        raise unsupported_region(region)
 
     # Parse the original date string in UTC time
     original_date = datetime.strptime(original_date_str, "%Y-%m-%d %H:%M:%S")
-    utc_timezone = timezone.utc
-    original_date_utc = original_date.replace(tzinfo=utc_timezone)
-
-    # Add 7 hours to the original date to convert it to Jakarta time
-    jakarta_offset = timedelta(hours=7)
-    jakarta_date = original_date_utc + jakarta_offset
-    jakarta_date = jakarta_date.replace(tzinfo=timezone(timedelta(hours=7)))
-    return jakarta_date
+    return original_date.replace(tzinfo=timezone.utc).astimezone(local_timezone)
 
 import phonenumbers
 
@@ -95,10 +133,7 @@ def classify_number(phone_number: int, call_type: str, call_from: str, call_to:
 
     # Console number type decides international vs local
     if console_number_type.upper() == "OVERSEAS":
-        for prefix, country in INTERNATIONAL_PHONE_PREFIXES.items():
-            if phone_number_str.startswith(str(prefix).replace("+", "")):
-                return f"International - {country}"
-        return "International - Unknown"
+        return classify_international_number(phone_number_str)
 
     # Local: emergency number
     if len(phone_number_str) in [3, 4, 5]:
@@ -106,11 +141,10 @@ def classify_number(phone_number: int, call_type: str, call_from: str, call_to:
         if classification:
             return classification
 
-    # Local: phone prefixes
-    sorted_prefixes = sorted(map(str, PHONE_PREFIXES.keys()), key=len, reverse=True)
-    for prefix in sorted_prefixes:
-        if phone_number_str.startswith(prefix):
-            return PHONE_PREFIXES.get(int(prefix))
+    # Local: phone prefixes (longest match wins)
+    prefix = PHONE_PREFIX_INDEX.longest_match(phone_number_str)
+    if prefix is not None:
+        return PHONE_PREFIXES.get(int(prefix))
 
     # Local: special prefixes
     for prefix in SPECIAL_PREFIXES:
@@ -122,6 +156,37 @@ def classify_number(phone_number: int, call_type: str, call_from: str, call_to:
         return "Fixed/Mobile"
     return "Unknown number type"
 
+def classification_labels() -> set[str]:
+    """Every label classify_number can return (besides None for unmatched special prefixes)."""
+    labels = {
+        "Internal Call",
+        "Internal Call (No answer)",
+        "Voicemail",
+        "Automatic Transfer",
+        "Monitoring",
+        "scancall",
+        "International - Unknown",
+        "Fixed/Mobile",
+        "Unknown number type",
+    }
+    labels.update(f"International - {country}" for country in INTERNATIONAL_PHONE_PREFIXES.values())
+    labels.update(EMERGENCY_NUMBERS.values())
+    labels.update(PHONE_PREFIXES.values())
+    return labels
+
+def classify_international_number(phone_number_str: str) -> str:
+    # Longest match, so 1809 (DOM) wins over 1 (USA/CAN) and 436 over 43.
+    country = INTERNATIONAL_PREFIX_INDEX.lookup(phone_number_str)
+    if country is None:
+        return "International - Unknown"
+    return f"International - {country}"
+
+def prefix_table_warnings() -> list[str]:
+    """Human-readable lines for duplicate keys found while compiling the prefix tables."""
+    return format_conflicts("PHONE_PREFIXES", PHONE_PREFIX_INDEX.conflicts) + format_conflicts(
+        "INTERNATIONAL_PHONE_PREFIXES", INTERNATIONAL_PREFIX_INDEX.conflicts
+    )
+
 def format_datetime_as_human_readable(datetime_object: Optional[datetime]) -> str:
     return datetime_object.strftime("%Y-%m-%d %H:%M:%S") if datetime_object else "-"
 
@@ -134,6 +199,15 @@ def format_timedelta(time_duration: timedelta) -> str:
     time_str = time_parts[-1]
     return time_str
 
+def format_duration(seconds: int) -> str:
+    """format_timedelta for int seconds: "H:MM:SS", whole days dropped."""
+    seconds %= 86400
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+def format_charge(charge: int | float) -> str:
+    """A charge as the merged CSV shows it: 1700 for an int rate, 1700.0 for a float one."""
+    return str(charge)
+
 def format_username(user_name: str) -> str:
     return user_name if user_name else "-"
 
@@ -154,10 +228,51 @@ def parse_jakarta_datetime(datetime_str: str, region: str) -> Optional[datetime]
         return None
     return convert_to_jakarta_time_iso(datetime_str, region)
 
-def parse_time_duration(time_duration_string: str) -> timedelta:
+def parse_time_duration(time_duration_string: str | timedelta) -> timedelta:
+    if isinstance(time_duration_string, timedelta):
+        return time_duration_string
     hours, minutes, seconds = time_duration_string.split(":")
     return timedelta(hours=int(hours), minutes=int(minutes), seconds=int(seconds))
 
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+ONE_SECOND = timedelta(seconds=1)
+# One shared tzinfo object per offset, so millions of timestamps don't each carry their own.
+_TIMEZONES: dict = {}
+
+def to_epoch_seconds(value: Optional[datetime]) -> tuple[Optional[int], Optional[tzinfo]]:
+    """(UTC epoch seconds, tzinfo) for a datetime; naive datetimes count as UTC, as in call_hash."""
+    if value is None:
+        return None, None
+    tz = value.tzinfo
+    if tz is not None:
+        tz = _TIMEZONES.setdefault(tz, tz)
+    aware = value if tz is not None else value.replace(tzinfo=timezone.utc)
+    return (aware - EPOCH) // ONE_SECOND, tz
+
+def from_epoch_seconds(seconds: Optional[int], tz: Optional[tzinfo] = None) -> Optional[datetime]:
+    """Inverse of to_epoch_seconds (to the second)."""
+    if seconds is None:
+        return None
+    if tz is None:
+        return datetime(1970, 1, 1) + timedelta(seconds=seconds)
+    return (EPOCH + timedelta(seconds=seconds)).astimezone(tz)
+
+# How a missing sequence ID / call_id arrives: empty, or "nan" once pandas has read an empty cell as text.
+MISSING_SEQUENCE_IDS = ("", "nan")
+
+def has_sequence_id(sequence_id) -> bool:
+    return bool(sequence_id) and sequence_id not in MISSING_SEQUENCE_IDS
+
 def set_if_empty(current_value, new_value):
     """Return new_value if current_value is empty or None, else keep current_value."""
-    return new_value if not current_value and new_value else current_value
\ No newline at end of file
+    return new_value if not current_value and new_value else current_value
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process in MB, or None where unsupported (Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024